@@ -0,0 +1,35 @@
+"""02_source_hash_and_blob_source_indices.
+
+Revision ID: 5c1f0e7a9b42
+Revises: 17da326cb886
+Create Date: 2026-10-17 10:12:40.418203
+"""
+from collections.abc import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1f0e7a9b42'
+down_revision: str | None = '17da326cb886'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('source', schema=None) as batch_op:
+        batch_op.create_index('ix_source_context_id_hash', ['context_id', 'hash'], unique=True)
+
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_blob_source_id'), ['source_id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_blob_source_id'))
+
+    with op.batch_alter_table('source', schema=None) as batch_op:
+        batch_op.drop_index('ix_source_context_id_hash')
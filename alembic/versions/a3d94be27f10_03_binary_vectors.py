@@ -0,0 +1,93 @@
+"""03_binary_vectors.
+
+Revision ID: a3d94be27f10
+Revises: 5c1f0e7a9b42
+Create Date: 2026-10-17 11:03:52.771904
+"""
+from collections.abc import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from numpy import float32
+
+from alembic import op
+from wizz.extraction import converters
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d94be27f10'
+down_revision: str | None = '5c1f0e7a9b42'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+_VECTOR_TABLES = ('source', 'blob')
+_BACKFILL_BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    for table_name in _VECTOR_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('vector', sa.LargeBinary(), nullable=True))
+        _backfill(
+            table_name,
+            source_column='vector_hex',
+            target_column='vector',
+            convert=bytes.fromhex,
+        )
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.alter_column('vector', existing_type=sa.LargeBinary(), nullable=False)
+            batch_op.drop_column('vector_hex')
+
+
+def downgrade() -> None:
+    for table_name in _VECTOR_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('vector_hex', sa.String(), nullable=True))
+        _backfill(
+            table_name,
+            source_column='vector',
+            target_column='vector_hex',
+            convert=_to_float32_hex,
+        )
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.alter_column('vector_hex', existing_type=sa.String(), nullable=False)
+            batch_op.drop_column('vector')
+
+
+def _to_float32_hex(stored: bytes) -> str:
+    """Encode a vector of any stored precision the old way, as float32 hex."""
+    return converters.vector_to_bytes(
+        converters.bytes_to_vector(stored),
+        float32,
+    ).hex()
+
+
+def _backfill(table_name, *, source_column, target_column, convert) -> None:
+    """Convert a column into another in place, in batches ordered by id."""
+    connection = op.get_bind()
+    table = sa.table(
+        table_name,
+        sa.column('id', sa.Integer()),
+        sa.column(source_column),
+        sa.column(target_column),
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(table.c.id, table.c[source_column])
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(_BACKFILL_BATCH_SIZE),
+        ).all()
+        if not rows:
+            return
+        connection.execute(
+            table.update()
+            .where(table.c.id == sa.bindparam('row_id'))
+            .values({target_column: sa.bindparam('converted')}),
+            [
+                {'row_id': row_id, 'converted': convert(stored)}
+                for row_id, stored in rows
+            ],
+        )
+        last_id = rows[-1][0]
@@ -0,0 +1,62 @@
+"""05_blob_full_text_search.
+
+Revision ID: c4f8a21e6d57
+Revises: e6b2c48d1f03
+Create Date: 2026-10-17 18:02:41.528193
+"""
+from collections.abc import Sequence
+from typing import Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f8a21e6d57'
+down_revision: str | None = 'e6b2c48d1f03'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# The index reads the texts from the blob table instead of a copy,
+# and the triggers keep it in sync with every change of a blob.
+_CREATE_TABLE = """
+CREATE VIRTUAL TABLE blob_fts USING fts5(
+    text,
+    content='blob',
+    content_rowid='id'
+)
+"""
+_CREATE_TRIGGERS = (
+    """
+    CREATE TRIGGER blob_fts_insert AFTER INSERT ON blob BEGIN
+        INSERT INTO blob_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER blob_fts_delete AFTER DELETE ON blob BEGIN
+        INSERT INTO blob_fts (blob_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER blob_fts_update AFTER UPDATE OF text ON blob BEGIN
+        INSERT INTO blob_fts (blob_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO blob_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+_TRIGGER_NAMES = ('blob_fts_insert', 'blob_fts_delete', 'blob_fts_update')
+
+
+def upgrade() -> None:
+    op.execute(_CREATE_TABLE)
+    for create_trigger in _CREATE_TRIGGERS:
+        op.execute(create_trigger)
+    # Index the blobs loaded before the migration.
+    op.execute("INSERT INTO blob_fts (blob_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    for trigger_name in _TRIGGER_NAMES:
+        op.execute(f'DROP TRIGGER {trigger_name}')
+    op.execute('DROP TABLE blob_fts')
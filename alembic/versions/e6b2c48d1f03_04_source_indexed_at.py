@@ -0,0 +1,29 @@
+"""04_source_indexed_at.
+
+Revision ID: e6b2c48d1f03
+Revises: a3d94be27f10
+Create Date: 2026-10-17 14:26:09.315847
+"""
+from collections.abc import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b2c48d1f03'
+down_revision: str | None = 'a3d94be27f10'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('source', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('indexed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('source', schema=None) as batch_op:
+        batch_op.drop_column('indexed_at')
@@ -0,0 +1,85 @@
+"""Compare the embedding backends on the sections of a directory.
+
+Chunks the text files under a directory like load does, encodes
+the sections with every backend, and reports their throughput and
+how closely the vectors agree with the ones of the torch backend.
+Fails if the agreement falls below ONNX_MIN_COSINE_AGREEMENT.
+
+Usage: python scripts/benchmark_embedders.py DIRECTORY [MAX_SECTIONS]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from wizz.extraction.batcher import TextBatcher
+from wizz.extraction.constants import ONNX_MIN_COSINE_AGREEMENT
+from wizz.extraction.embedder import Embedder
+from wizz.filesystem import discover_files
+from wizz.filesystem import read_text
+from wizz.interface.enums import EmbeddingBackend
+
+DEFAULT_MAX_SECTIONS = 2048
+
+
+def collect_sections(directory: str, max_sections: int) -> list[str]:
+    """Chunk the files of a directory into at most a number of sections."""
+    sections: list[str] = []
+    for path in discover_files(directory):
+        filecontent = read_text(os.path.join(directory, path))
+        sections.extend(textblob for _, textblob in TextBatcher(filecontent))
+        if len(sections) >= max_sections:
+            break
+    return sections[:max_sections]
+
+
+def encode_timed(
+    backend: EmbeddingBackend,
+    sections: list[str],
+) -> tuple[np.ndarray, float]:
+    """Encode sections with a backend and measure the throughput."""
+    embedder = Embedder(use_cache=False, backend=backend)
+    # The first pass warms up the runtime.
+    embedder(sections[:embedder.batch_size])
+    started = time.perf_counter()
+    vectors = embedder(sections)
+    return vectors, len(sections) / (time.perf_counter() - started)
+
+
+def cosine_agreement(vectors: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Compute the cosine similarity of every vector to its reference."""
+    norms = np.linalg.norm(vectors, axis=1)
+    reference_norms = np.linalg.norm(reference, axis=1)
+    return np.sum(vectors * reference, axis=1) / (norms * reference_norms)
+
+
+def main() -> int:  # noqa: WPS210
+    """Run every backend and compare it to the torch backend."""
+    max_sections = DEFAULT_MAX_SECTIONS
+    if len(sys.argv) > 2:
+        max_sections = int(sys.argv[2])
+    sections = collect_sections(sys.argv[1], max_sections)
+    print('Encoding', len(sections), 'sections.')  # noqa: WPS421
+    reference, reference_rate = encode_timed(EmbeddingBackend.torch, sections)
+    print(f'torch: {reference_rate:.1f} sections/s')  # noqa: WPS421
+    is_agreeing = True
+    for backend in EmbeddingBackend:
+        if backend == EmbeddingBackend.torch:
+            continue
+        vectors, rate = encode_timed(backend, sections)
+        cosines = cosine_agreement(vectors, reference)
+        speedup = rate / reference_rate
+        print(  # noqa: WPS421
+            f'{backend}: {rate:.1f} sections/s, {speedup:.2f}x torch,',
+            'cosine to torch mean {mean:.4f} min {min:.4f}'.format(
+                mean=cosines.mean(),
+                min=cosines.min(),
+            ),
+        )
+        is_agreeing &= cosines.min() >= ONNX_MIN_COSINE_AGREEMENT
+    return int(not is_agreeing)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
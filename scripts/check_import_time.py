@@ -0,0 +1,67 @@
+"""Check that the CLI starts without importing the heavy dependencies.
+
+Imports the application in a fresh interpreter, fails if any of
+the heavy modules got imported along with it, or if the import
+took longer than the budget in seconds.
+
+Usage: python scripts/check_import_time.py [budget]
+"""
+import json
+import subprocess  # noqa: S404
+import sys
+
+DEFAULT_BUDGET = 2.0
+
+HEAVY_MODULES = (
+    'annoy',
+    'async_annoy',
+    'openai',
+    'scipy',
+    'sentence_transformers',
+    'tiktoken',
+    'torch',
+    'transformers',
+)
+
+_PROBE = """
+import json
+import sys
+import time
+
+started = time.perf_counter()
+import wizz.app
+elapsed = time.perf_counter() - started
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def main() -> int:
+    """Run the probe and report the budget and module violations."""
+    budget = DEFAULT_BUDGET
+    if len(sys.argv) > 1:
+        budget = float(sys.argv[1])
+    probe_output = subprocess.run(  # noqa: S603
+        [sys.executable, '-c', _PROBE],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    probe = json.loads(probe_output.splitlines()[-1])
+    imported_heavy = [
+        module_name
+        for module_name in HEAVY_MODULES
+        if module_name in probe['modules']
+    ]
+    print(f'Imported wizz.app in {probe["elapsed"]:.2f}s.')  # noqa: WPS421
+    if imported_heavy:
+        print(  # noqa: WPS421
+            'Heavy modules imported at startup:',
+            ', '.join(imported_heavy),
+        )
+    if probe['elapsed'] > budget:
+        print(f'Startup exceeds the budget of {budget:.2f}s.')  # noqa: WPS421
+    return int(bool(imported_heavy) or probe['elapsed'] > budget)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,12 @@
 from collections import deque
-
-from openai import OpenAI
-from openai.types.chat import ChatCompletion
+from typing import TYPE_CHECKING
 
 from wizz.interface.enums import MessageRole
 from wizz.interface.types import MessageTuple
 
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletion
+
 _DEFAULT_TOKEN_LIMIT = 256
 
 
@@ -22,6 +23,8 @@ class Chat:
         token_limit: int | None = None,
     ):
         """Set up the chatbot with an optional system message."""
+        from openai import OpenAI  # noqa: WPS433
+
         self.prepended_messages: list[MessageTuple] = (
             [(MessageRole.system, system_message)]
             if system_message
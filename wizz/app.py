@@ -1,7 +1,10 @@
 from typer import Typer
 
 from wizz.commands import knowledge
+from wizz.commands import serve
+from wizz.syncer import synchronize_async_command
 
 
 app = Typer()
 app.add_typer(knowledge.app, name='knowledge')
+synchronize_async_command(app, name='serve')(serve.serve)
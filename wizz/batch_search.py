@@ -0,0 +1,139 @@
+import json
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import TextIO
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wizz import constants
+from wizz import crud
+from wizz.interface.enums import SearchMode
+from wizz.retrieval import BlobRanker
+from wizz.retrieval import RankedBlobs
+
+QueryRecord = dict[str, Any]
+
+
+async def search_queries(
+    session: AsyncSession,
+    *,
+    queries_file: TextIO,
+    output_file: TextIO,
+    ranker: BlobRanker,
+    n: int,  # noqa: WPS111
+) -> int:
+    """Search every query of a JSONL file and write JSONL results.
+
+    Queries are ranked in batches: embedded in model passes and
+    looked up in the index by a pool of threads, and their blobs
+    are loaded in bulk. Every result line is the query line
+    with the search mode and the ranked blobs added.
+    Returns the number of queries searched.
+    """
+    searched = 0
+    with ThreadPoolExecutor() as executor:
+        for query_records in read_query_batches(queries_file):
+            result_records = await _to_result_records(
+                session,
+                query_records,
+                ranker.mode,
+                await ranker.rank_many(
+                    session,
+                    [query_record['query'] for query_record in query_records],
+                    n=n,
+                    executor=executor,
+                ),
+            )
+            output_file.writelines(
+                '{0}\n'.format(json.dumps(result_record))
+                for result_record in result_records
+            )
+            searched += len(query_records)
+    return searched
+
+
+def read_query_batches(
+    queries_file: TextIO,
+    batch_size: int = constants.QUERY_BATCH_SIZE,
+) -> Iterator[list[QueryRecord]]:
+    """Read the queries of a JSONL file in batches.
+
+    A line is either a JSON string or a JSON object with a query
+    string, and any other fields of the object are kept.
+    """
+    query_records: list[QueryRecord] = []
+    for line_number, line in enumerate(queries_file, start=1):
+        if not line.strip():
+            continue
+        query_records.append(_parse_query_line(line, line_number))
+        if len(query_records) == batch_size:
+            yield query_records
+            query_records = []
+    if query_records:
+        yield query_records
+
+
+def _parse_query_line(line: str, line_number: int) -> QueryRecord:
+    """Read a line of the queries file into a record with a query."""
+    try:
+        query_record = json.loads(line)
+    except ValueError as error:
+        raise ValueError(f'Line {line_number} is not JSON: {error}')
+    if isinstance(query_record, str):
+        return {'query': query_record}
+    query = (
+        query_record.get('query') if isinstance(query_record, dict) else None
+    )
+    if not isinstance(query, str):
+        raise ValueError(f'Line {line_number} has no query string.')
+    return query_record
+
+
+async def _to_result_records(
+    session: AsyncSession,
+    query_records: list[QueryRecord],
+    mode: SearchMode,
+    all_ranked_blobs: list[RankedBlobs],
+) -> list[QueryRecord]:
+    """Add the ranked blobs with their sources to the query records.
+
+    Blobs that were deleted since the index was built are left out.
+    """
+    blob_sources = await crud.load_blob_sources(
+        session,
+        blob_ids={
+            blob_id
+            for ranked_blobs in all_ranked_blobs
+            for blob_id, _ in ranked_blobs
+        },
+    )
+    return [
+        {
+            **query_record,
+            'mode': mode,
+            'results': [
+                {
+                    'blob_id': blob_id,
+                    'blob_index': blob_sources[blob_id].blob_index,
+                    'source': blob_sources[blob_id].source_name,
+                    **_to_rank_value(mode, rank_value),
+                }
+                for blob_id, rank_value in ranked_blobs
+                if blob_id in blob_sources
+            ],
+        }
+        for query_record, ranked_blobs in zip(query_records, all_ranked_blobs)
+    ]
+
+
+def _to_rank_value(mode: SearchMode, rank_value: float) -> dict[str, float]:
+    """Name the value a blob was ranked by in a search mode.
+
+    Vector search gives distances, which rank lower first. Lexical
+    and hybrid searches rank by negated BM25 and fusion scores,
+    given back as scores, which rank higher first.
+    """
+    if mode == SearchMode.vector:
+        return {'distance': rank_value}
+    return {'score': -rank_value}
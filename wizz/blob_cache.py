@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from sqlalchemy import Row
+
+
+class BlobCache:
+    """A least recently used cache of blob rows by their IDs.
+
+    Blobs do not change once they are loaded, so a cached row
+    stays valid until the context of the blob is deleted.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """Hold up to max_size rows."""
+        self.max_size = max_size
+        self._rows: OrderedDict[int, Row] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Count the cached rows."""
+        return len(self._rows)
+
+    def get_many(self, blob_ids: Iterable[int]) -> dict[int, Row]:
+        """Get the cached rows of the IDs, marking them as recently used."""
+        found_rows = {}
+        for blob_id in blob_ids:
+            row = self._rows.get(blob_id)
+            if row is not None:
+                self._rows.move_to_end(blob_id)
+                found_rows[blob_id] = row
+        return found_rows
+
+    def put_many(self, rows: Iterable[Row]) -> None:
+        """Cache rows by their ID, evicting the least recently used ones."""
+        for row in rows:
+            self._rows[row.id] = row
+            self._rows.move_to_end(row.id)
+        while len(self._rows) > self.max_size:
+            self._rows.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all rows."""
+        self._rows.clear()
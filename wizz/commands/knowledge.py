@@ -1,23 +1,38 @@
-import asyncio
+from contextlib import nullcontext
 from logging import getLogger
+from typing import Optional
 
 import typer
-from async_annoy import AsyncAnnoy
 from dotenv import load_dotenv
 from rich import print as rich_print
 from rich import prompt as rich_prompt
 from rich.progress import Progress
 
+from wizz import batch_search
 from wizz import crud
+from wizz import indexing
 from wizz.agent.retriever import Retriever
+from wizz.constants import SEARCH_RESULT_COUNT
 from wizz.database import get_db_session
 from wizz.extraction import converters
-from wizz.extraction.batcher import TextBatcher
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.constants import INDEX_SEARCH_K
 from wizz.extraction.embedder import Embedder
-from wizz.extraction.outlier_finder import find_outliers_for
-from wizz.filesystem import get_file_streamer
-from wizz.filesystem import shorten_filename
-from wizz.models import knowledge as knowledge_models
+from wizz.extraction.embedding_pool import EmbeddingPool
+from wizz.extraction.vector_index import build_vector_index
+from wizz.extraction.vector_index import read_build_profile
+from wizz.extraction.vector_index import remove_vector_index
+from wizz.extraction.vector_index import resolve_build_profile
+from wizz.extraction.vector_store import VectorStore
+from wizz.filesystem import DEFAULT_INCLUDE_PATTERNS
+from wizz.filesystem import discover_files
+from wizz.ingestion import IngestionPipeline
+from wizz.interface.enums import ChunkingMode
+from wizz.interface.enums import EmbeddingBackend
+from wizz.interface.enums import IndexKind
+from wizz.interface.enums import SearchMode
+from wizz.interface.enums import VectorPrecision
+from wizz.retrieval import BlobRanker
 from wizz.syncer import synchronize_async_command
 
 load_dotenv()
@@ -28,7 +43,7 @@ app = typer.Typer(invoke_without_command=False)
 
 
 @synchronize_async_command(app)
-async def load(  # noqa: WPS210, WPS213, WPS217
+async def load(  # noqa: WPS210, WPS211
     context_name: str = typer.Option(  # noqa: WPS404, B008
         ...,
         help='The name of the context to bind the knowledge to.',
@@ -40,78 +55,133 @@ async def load(  # noqa: WPS210, WPS213, WPS217
         readable=True,
         dir_okay=True,
     ),
+    include: list[str] = typer.Option(  # noqa: WPS404, B008
+        list(DEFAULT_INCLUDE_PATTERNS),  # noqa: B006
+        help='Glob patterns of the files to load.',
+    ),
+    exclude: list[str] = typer.Option(  # noqa: WPS404, B008
+        [],
+        help='Glob patterns of the files and directories to skip.',
+    ),
+    batch_size: int = typer.Option(  # noqa: WPS404, B008
+        EMBEDDING_BATCH_SIZE,
+        help='The number of sections to embed in one model pass.',
+        min=1,
+    ),
+    workers: int = typer.Option(  # noqa: WPS404, B008
+        1,
+        help='The number of embedding processes to run in parallel.',
+        min=1,
+    ),
+    vector_precision: VectorPrecision = typer.Option(  # noqa: WPS404, B008
+        VectorPrecision.float32,
+        help='The precision to store the vectors in.',
+    ),
+    use_cache: bool = typer.Option(  # noqa: WPS404, B008
+        True,  # noqa: WPS425
+        '--cache/--no-cache',
+        help='Reuse the vectors of sections embedded before.',
+    ),
+    backend: EmbeddingBackend = typer.Option(  # noqa: WPS404, B008
+        EmbeddingBackend.torch,
+        envvar='WIZZ_EMBEDDING_BACKEND',
+        help='The runtime to compute the embeddings with.',
+    ),
+    chunking: ChunkingMode = typer.Option(  # noqa: WPS404, B008
+        ChunkingMode.tiktoken,
+        help='The tokenizer to size the chunks with.',
+    ),
 ) -> None:
     """Read a directory and load its contents into the knowledge base."""
-    embedder = Embedder()
-    number_of_files, file_stream = get_file_streamer(load_path)
-    number_of_existing_files = 0
-    with Progress(
+    embedder_options = {
+        'batch_size': batch_size,
+        'use_cache': use_cache,
+        'backend': backend,
+    }
+    embedder_context = (
+        EmbeddingPool(workers, **embedder_options)
+        if workers > 1
+        else nullcontext(Embedder(**embedder_options))
+    )
+    with embedder_context as embedder, Progress(  # noqa: WPS316
         transient=True,
         refresh_per_second=2,
     ) as progress:
-        file_task = progress.add_task(
-            'Processing files...', total=number_of_files,
+        file_task = progress.add_task('Processing files...', total=0)
+        pipeline = IngestionPipeline(
+            embedder,
+            context_name=context_name,
+            # Every worker gets a full batch from each pipeline step.
+            batch_size=batch_size * workers,
+            vector_precision=vector_precision,
+            chunking=chunking,
+            on_file_found=lambda: progress.update(
+                file_task,
+                total=pipeline.found_files,
+            ),
+            on_file_done=lambda: progress.update(file_task, advance=1),
+        )
+        await pipeline.run(
+            discover_files(load_path, include=include, exclude=exclude),
+            directory=load_path,
+        )
+        embedding_cache = embedder.cache
+    if embedding_cache is not None:
+        rich_print(
+            'Embedding cache: {hits} hits, {misses} misses.'.format(
+                hits=embedding_cache.hits,
+                misses=embedding_cache.misses,
+            ),
         )
-        async with get_db_session() as session:
-            context_instance = await crud.get_or_create_context(
-                session,
-                name=context_name,
-            )
-            for filename, filecontent, hashstr in file_stream:
-                if await crud.does_source_exist(session, hashstring=hashstr):
-                    progress.update(file_task, advance=1)
-                    number_of_existing_files += 1
-                    continue
-                blob_task = progress.add_task(
-                    shorten_filename(filename),
-                    total=None,
-                )
-                source_vector_hex = converters.vector_to_hex(
-                    embedder(filecontent),
-                )
-                source_instance = await crud.create_source(
-                    session,
-                    context=context_instance,
-                    name=filename,
-                    content_hash=hashstr,
-                    vector_hex=source_vector_hex,
-                    commit=False,  # type: ignore
-                )
-                await session.commit()
-                for ix, textblob in TextBatcher(filecontent):
-                    blob_vector_hex = converters.vector_to_hex(
-                        embedder(textblob),
-                    )
-                    await crud.create_blob(
-                        session,
-                        source=source_instance,
-                        text=textblob,
-                        index=ix,
-                        vector_hex=blob_vector_hex,
-                        commit=False,  # type: ignore
-                    )
-                await session.commit()
-                progress.update(blob_task, visible=False)
-                progress.update(file_task, advance=1)
     rich_print(
         'Skipped {skipped} already loaded files.'.format(
-            skipped=number_of_existing_files,
+            skipped=pipeline.skipped_files,
         ),
         'Loaded {delta} new files into the knowledge base.'.format(
-            delta=number_of_files - number_of_existing_files,
+            delta=pipeline.loaded_files,
         ),
         sep='\n',
     )
 
 
 @synchronize_async_command(app)
-async def index(  # noqa: WPS210, WPS213, WPS217
+async def index(  # noqa: WPS210, WPS211, WPS213, WPS217
     context_name: str = typer.Option(  # noqa: WPS404, B008
         ...,
         help='The name of the knowledge context.',
     ),
+    full: bool = typer.Option(  # noqa: WPS404, B008
+        False,  # noqa: WPS425
+        '--full',
+        help='Relink all sources instead of only the new ones.',
+    ),
+    index_kind: Optional[IndexKind] = typer.Option(  # noqa: WPS404, B008
+        None,
+        help='The kind of indices, where automatic picks one by their size.',
+    ),
+    trees: Optional[int] = typer.Option(  # noqa: WPS404, B008
+        None,
+        help='The number of trees per Annoy index, more give better recall.',
+        min=1,
+    ),
+    jobs: Optional[int] = typer.Option(  # noqa: WPS404, B008
+        None,
+        help='The number of threads to build indices with, -1 for all.',
+    ),
+    on_disk_build: Optional[bool] = typer.Option(  # noqa: WPS404, B008
+        None,
+        '--on-disk-build/--in-memory-build',
+        help='Build Annoy indices in their files, when they exceed memory.',
+    ),
 ) -> None:
-    """Add semantic coordinates to indices and build links."""
+    """Add semantic coordinates to indices and build links.
+
+    Only sources loaded since the last run are linked, and the indices
+    are rebuilt only if there are such sources, the indices are missing,
+    or they were built with other parameters. Build parameters that are
+    not given are the ones of the last build. Automatic indices are exact
+    when small, and use Annoy, or HNSW if hnswlib is installed, when big.
+    """
     with Progress(transient=True, refresh_per_second=2) as progress:
         async with get_db_session() as session:
             context_instance = await crud.get_or_create_context(
@@ -119,129 +189,213 @@ async def index(  # noqa: WPS210, WPS213, WPS217
                 name=context_name,
             )
 
-            # Index sources
-            total_sources = await crud.count_objects(
+            source_index_name = converters.to_source_ix_name(context_name)
+            blob_index_name = converters.to_blob_ix_name(context_name)
+            source_store = VectorStore(source_index_name)
+            blob_store = VectorStore(blob_index_name)
+            await indexing.sync_vector_stores(
+                session,
+                context=context_instance,
+                source_store=source_store,
+                blob_store=blob_store,
+            )
+            if full:
+                rich_print('Flushing all existing links...')
+                await crud.remove_all_links_for(
+                    session,
+                    context=context_instance,
+                    commit=False,
+                )
+                await crud.reset_index_state(session, context=context_instance)
+            # Sources loaded after this point are left for the next run.
+            new_source_ids = await crud.get_unindexed_source_ids(
                 session,
-                model=knowledge_models.Source,
+                context=context_instance,
+            )
+            new_sources = len(new_source_ids)
+            skipped_sources = len(source_store) - new_sources
+            index_profiles = {
+                index_name: resolve_build_profile(
+                    read_build_profile(index_name),
+                    size=len(store),
+                    kind=index_kind,
+                    trees=trees,
+                    jobs=jobs,
+                    on_disk_build=on_disk_build,
+                )
+                for index_name, store in (
+                    (source_index_name, source_store),
+                    (blob_index_name, blob_store),
+                )
+            }
+            is_built = all(
+                index_profile.builds_like(read_build_profile(index_name))
+                for index_name, index_profile in index_profiles.items()
             )
+            if not new_sources and is_built:
+                rich_print(
+                    f'Skipped {skipped_sources} already indexed sources.',
+                    'Indices are up to date.',
+                )
+                return
+
+            # Index sources
+            total_sources = len(source_store)
             source_indexing_task = progress.add_task(
                 'Indexing sources...',
                 total=total_sources,
             )
-            source_index_name = converters.to_source_ix_name(context_name)
-            async with AsyncAnnoy(source_index_name).writer() as swriter:
-                source_stream = await crud.stream_sources(
-                    session,
-                    context=context_instance,
-                )
-                for source in source_stream:
-                    await swriter.add_item(
-                        source.id,
-                        converters.hex_to_vector(source.vector_hex),
-                    )
-                    progress.update(source_indexing_task, advance=1)
-                rich_print(f'Indexed {total_sources} sources.')
+            source_index = build_vector_index(
+                source_index_name,
+                *source_store.load(),
+                profile=index_profiles[source_index_name],
+                on_added=lambda added: progress.update(
+                    source_indexing_task,
+                    advance=added,
+                ),
+            )
+            rich_print(
+                f'Indexed {total_sources} sources',
+                f'with {index_profiles[source_index_name].kind} search.',
+            )
 
             # Index blobs
-            total_blobs = await crud.count_objects(
-                session,
-                model=knowledge_models.Blob,
-            )
+            total_blobs = len(blob_store)
             blob_indexing_task = progress.add_task(
                 'Indexing blobs...',
                 total=total_blobs,
             )
-            blob_index_name = converters.to_blob_ix_name(context_name)
-            async with AsyncAnnoy(blob_index_name).writer() as bwriter:
-                blob_stream = await crud.stream_blobs(
-                    session,
-                    context=context_instance,
-                )
-                for blob in blob_stream:
-                    await bwriter.add_item(
-                        blob.id,
-                        converters.hex_to_vector(blob.vector_hex),
-                    )
-                    progress.update(blob_indexing_task, advance=1)
-                rich_print(f'Indexed {total_blobs} blobs.')
+            build_vector_index(
+                blob_index_name,
+                *blob_store.load(),
+                profile=index_profiles[blob_index_name],
+                on_added=lambda added: progress.update(
+                    blob_indexing_task,
+                    advance=added,
+                ),
+            )
+            rich_print(
+                f'Indexed {total_blobs} blobs',
+                f'with {index_profiles[blob_index_name].kind} search.',
+            )
 
             # Find links
-            rich_print('Flushing all existing links...')
-            await crud.remove_all_links_for(
+            rich_print(
+                f'Skipping {skipped_sources} already linked sources,',
+                f'linking {new_sources} new ones...',
+            )
+            # Links of an interrupted run are replaced, not duplicated.
+            await crud.remove_links_of_unindexed_sources(
                 session,
                 context=context_instance,
+                commit=False,
             )
             rich_print('Finding semantic outliers for linking...')
-            sources = await crud.stream_sources(
+            outliers = await indexing.find_context_outliers(
                 session,
                 context=context_instance,
+                source_store=source_store,
+                blob_store=blob_store,
+                only_unindexed=True,
             )
-            outliers: dict[int, tuple] = {}
-            for src in sources:
-                outliers.update(await find_outliers_for(src))
-            total_outliers = len(outliers)
+            total_outliers = len(outliers.blob_ids)
             rich_print(f'Found {total_outliers} outliers.')
             linking_task = progress.add_task(
                 'Linking outliers...',
                 total=total_outliers,
             )
-            async with AsyncAnnoy(source_index_name).reader() as source_reader:
-                for blb, vector, origin_distance in outliers.values():
-                    ranked_destinations = (
-                        await source_reader.get_ranked_neighbours_for(
-                            vector=vector,
-                            n=1,
-                        )
-                    )
-                    destination_id, destination_dist = ranked_destinations[0]
-                    destination = await crud.get_single_object(
-                        session,
-                        model=knowledge_models.Source,
-                        object_id=destination_id,
-                    )
-                    await crud.create_link(
-                        session,
-                        blob=blb,
-                        target_source=destination,
-                        origin_distance=origin_distance,
-                        destination_distance=destination_dist,
-                    )
-                    progress.update(linking_task, advance=1)
-                await session.commit()
-                rich_print('Linked all outliers.')
+            total_links = await indexing.link_outliers(
+                session,
+                outliers=outliers,
+                source_index=source_index,
+                on_linked=lambda linked: progress.update(
+                    linking_task,
+                    advance=linked,
+                ),
+            )
+            await crud.mark_sources_indexed(
+                session,
+                source_ids=new_source_ids,
+            )
+            rich_print(f'Linked {total_links} outliers.')
     rich_print('Done!')
 
 
 @synchronize_async_command(app)
-async def search(  # noqa: WPS210, WPS217
+async def search(  # noqa: WPS210, WPS211, WPS217
     context_name: str = typer.Option(  # noqa: WPS404, B008
         ...,
         help='The name of the context to bind the knowledge to.',
     ),
+    backend: EmbeddingBackend = typer.Option(  # noqa: WPS404, B008
+        EmbeddingBackend.torch,
+        envvar='WIZZ_EMBEDDING_BACKEND',
+        help='The runtime to compute the embeddings with.',
+    ),
+    search_k: int = typer.Option(  # noqa: WPS404, B008
+        INDEX_SEARCH_K,
+        envvar='WIZZ_SEARCH_K',
+        help='The number of index nodes to inspect per query, more for recall.',
+    ),
+    k: int = typer.Option(  # noqa: WPS111, WPS404, B008
+        SEARCH_RESULT_COUNT,
+        '--k',
+        help='The number of blobs to find per query.',
+        min=1,
+    ),
+    queries_file: Optional[typer.FileText] = typer.Option(  # noqa: WPS404, B008
+        None,
+        help='A JSONL file of queries to search instead of prompting.',
+    ),
+    output: typer.FileTextWrite = typer.Option(  # noqa: WPS404, B008
+        '-',
+        help='The JSONL file to write the results of the queries file to.',
+    ),
+    batch_size: int = typer.Option(  # noqa: WPS404, B008
+        EMBEDDING_BATCH_SIZE,
+        help='The number of queries to embed in one model pass.',
+        min=1,
+    ),
+    mode: SearchMode = typer.Option(  # noqa: WPS404, B008
+        SearchMode.vector,
+        envvar='WIZZ_SEARCH_MODE',
+        help='Rank by vectors, by words with BM25, or by both fused.',
+    ),
 ):
-    """Search the knowledge base for a query."""
-    embedder = Embedder()
-    retriever = Retriever()
+    """Search the knowledge base for a query.
+
+    With a queries file, searches all of its queries without prompting.
+    """
+    ranker = BlobRanker(
+        context_name,
+        mode=mode,
+        backend=backend,
+        batch_size=batch_size,
+        search_k=search_k,
+    )
     async with get_db_session() as session:
-        blob_ix_name = converters.to_blob_ix_name(context_name)
-        async with AsyncAnnoy(blob_ix_name).reader() as reader:
-            while query := rich_prompt.Prompt.ask('Enter a query'):
-                lookup_indices = await reader.get_neighbours_for(
-                    vector=embedder(query),
-                    n=5,
-                )
-                multiple_blobs = await crud.load_set_of_blobs(
-                    session,
-                    blob_ids=set(lookup_indices),
-                )
-                sources = await asyncio.gather(
-                    *(blob.awaitable_attrs.source for blob in multiple_blobs),
-                )
-                ellipted_texts = [
-                    retriever.wrap_result(source.name, blob.text)
-                    for source, blob in zip(sources, multiple_blobs)
-                ]
-                rich_print(*ellipted_texts, sep='\n\n')
+        if queries_file is not None:
+            searched = await batch_search.search_queries(
+                session,
+                queries_file=queries_file,
+                output_file=output,
+                ranker=ranker,
+                n=k,
+            )
+            logger.info('Searched %s queries.', searched)
+            return
+        retriever = Retriever()
+        while query := rich_prompt.Prompt.ask('Enter a query'):
+            ranked_blobs = await ranker.rank(session, query, n=k)
+            retrieved_blobs = await crud.retrieve_ranked_blobs(
+                session,
+                ranked_blobs=ranked_blobs,
+            )
+            ellipted_texts = [
+                retriever.wrap_result(blob.source_name, blob.text)
+                for blob in retrieved_blobs
+            ]
+            rich_print(*ellipted_texts, sep='\n\n')
     rich_print('Goodbye!')
 
 
@@ -251,35 +405,51 @@ async def interact(  # noqa: WPS210, WPS217
         ...,
         help='The name of the context to bind the knowledge to.',
     ),
+    backend: EmbeddingBackend = typer.Option(  # noqa: WPS404, B008
+        EmbeddingBackend.torch,
+        envvar='WIZZ_EMBEDDING_BACKEND',
+        help='The runtime to compute the embeddings with.',
+    ),
+    search_k: int = typer.Option(  # noqa: WPS404, B008
+        INDEX_SEARCH_K,
+        envvar='WIZZ_SEARCH_K',
+        help='The number of index nodes to inspect per query, more for recall.',
+    ),
+    mode: SearchMode = typer.Option(  # noqa: WPS404, B008
+        SearchMode.vector,
+        envvar='WIZZ_SEARCH_MODE',
+        help='Rank by vectors, by words with BM25, or by both fused.',
+    ),
 ):
     """Interact with LLM that has access to the knowledge base."""
     retriever = Retriever()
-    embedder = Embedder()
+    ranker = BlobRanker(
+        context_name,
+        mode=mode,
+        backend=backend,
+        search_k=search_k,
+    )
     async with get_db_session() as session:
-        blob_ix_name = converters.to_blob_ix_name(context_name)
-        async with AsyncAnnoy(blob_ix_name).reader() as reader:
-            while query := rich_prompt.Prompt.ask('\n\n'):
-                query = retriever.construct_query(query)
-                lookup_indices = await reader.get_neighbours_for(
-                    vector=embedder(query),
-                    n=5,
-                )
-                multiple_blobs = await crud.load_set_of_blobs(
-                    session,
-                    blob_ids=set(lookup_indices),
-                )
-                sources = await asyncio.gather(
-                    *(blob.awaitable_attrs.source for blob in multiple_blobs),
-                )
-                ellipted_texts = [
-                    retriever.wrap_result(source.name, blob.text)
-                    for source, blob in zip(sources, multiple_blobs)
-                ]
-                answer = retriever.request_answer_based_on(
-                    *ellipted_texts,
-                    query=query,
-                )
-                rich_print(answer, sep='\n\n')
+        while query := rich_prompt.Prompt.ask('\n\n'):
+            query = retriever.construct_query(query)
+            ranked_blobs = await ranker.rank(
+                session,
+                query,
+                n=SEARCH_RESULT_COUNT,
+            )
+            retrieved_blobs = await crud.retrieve_ranked_blobs(
+                session,
+                ranked_blobs=ranked_blobs,
+            )
+            ellipted_texts = [
+                retriever.wrap_result(blob.source_name, blob.text)
+                for blob in retrieved_blobs
+            ]
+            answer = retriever.request_answer_based_on(
+                *ellipted_texts,
+                query=query,
+            )
+            rich_print(answer, sep='\n\n')
     rich_print('Goodbye!')
 
 
@@ -306,5 +476,12 @@ async def delete(  # noqa: WPS210, WPS217
             session,
             context=context_instance,
         )
-        # No need to delete the Annoy index,
-        # because it will be overwritten on the next load.
+        # Vector stores are appended to on load, so they go too,
+        # and so do the indices with the build profiles stored with them.
+        index_names = (
+            converters.to_source_ix_name(context_name),
+            converters.to_blob_ix_name(context_name),
+        )
+        for index_name in index_names:
+            VectorStore(index_name).remove()
+            remove_vector_index(index_name)
@@ -0,0 +1,77 @@
+import asyncio
+from logging import getLogger
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+from rich import print as rich_print
+
+from wizz import constants
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.constants import INDEX_SEARCH_K
+from wizz.extraction.embedder import Embedder
+from wizz.extraction.query_batcher import QueryBatcher
+from wizz.interface.enums import EmbeddingBackend
+from wizz.server.handler import RequestHandler
+from wizz.server.service import SearchService
+
+load_dotenv()
+
+logger = getLogger('wizz')
+
+
+async def serve(  # noqa: WPS211
+    host: str = typer.Option(  # noqa: WPS404, B008
+        constants.SERVE_HOST,
+        envvar='WIZZ_SERVE_HOST',
+        help='The address to listen on.',
+    ),
+    port: int = typer.Option(  # noqa: WPS404, B008
+        constants.SERVE_PORT,
+        envvar='WIZZ_SERVE_PORT',
+        help='The TCP port to listen on.',
+    ),
+    socket_path: Optional[str] = typer.Option(  # noqa: WPS404, B008
+        None,
+        '--socket',
+        help='A Unix socket to listen on instead of the TCP port.',
+    ),
+    backend: EmbeddingBackend = typer.Option(  # noqa: WPS404, B008
+        EmbeddingBackend.torch,
+        envvar='WIZZ_EMBEDDING_BACKEND',
+        help='The runtime to compute the embeddings with.',
+    ),
+    search_k: int = typer.Option(  # noqa: WPS404, B008
+        INDEX_SEARCH_K,
+        envvar='WIZZ_SEARCH_K',
+        help='The number of index nodes to inspect per query, more for recall.',
+    ),
+    batch_size: int = typer.Option(  # noqa: WPS404, B008
+        EMBEDDING_BATCH_SIZE,
+        help='The most queries to embed in one model pass.',
+        min=1,
+    ),
+    batch_delay: float = typer.Option(  # noqa: WPS404, B008
+        constants.SERVE_BATCH_DELAY,
+        help='Seconds a query waits for others to share its model pass.',
+        min=0,
+    ),
+):
+    """Serve searches and answers over HTTP with the models kept loaded."""
+    query_batcher = QueryBatcher(
+        Embedder(use_cache=False, backend=backend),
+        max_size=batch_size,
+        max_delay=batch_delay,
+    )
+    request_handler = RequestHandler(
+        SearchService(query_batcher, search_k=search_k),
+    )
+    if socket_path is None:
+        server = await asyncio.start_server(request_handler, host, port)
+        address = f'http://{host}:{port}'
+    else:
+        server = await asyncio.start_unix_server(request_handler, socket_path)
+        address = f'unix:{socket_path}'
+    rich_print(f'Serving on [bold]{address}[/bold].')
+    async with query_batcher, server:  # noqa: WPS316
+        await server.serve_forever()
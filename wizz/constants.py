@@ -1 +1,32 @@
 DATABASE_URL = 'sqlite+aiosqlite:///./wizzdata.db'
+
+INGESTION_QUEUE_SIZE = 16
+BULK_INSERT_SIZE = 1000
+# Rows read from the database at a time when streaming.
+READ_PARTITION_SIZE = 10000
+LINK_BATCH_SIZE = 10000
+# IDs looked up in one query, below the bound parameter limit of SQLite.
+LOOKUP_SIZE = 10000
+# Recently retrieved blobs kept in memory by search.
+BLOB_CACHE_SIZE = 4096
+# Candidates of each ranking that hybrid search fuses.
+HYBRID_CANDIDATES = 50
+# Reciprocal rank fusion smooths the ranks by this constant.
+RRF_K = 60
+# Queries of a file searched at a time, between writes of the results.
+QUERY_BATCH_SIZE = 1024
+# Query vectors one thread looks up in the index at a time.
+INDEX_LOOKUP_BATCH_SIZE = 64
+# The outlier's own source is at most one of its neighbours.
+LINK_NEIGHBOURS = 2
+# Files larger than this many bytes are chunked as a stream of pieces.
+STREAMING_FILE_SIZE = 100 * 1024 * 1024
+TEXT_PIECE_SIZE = 1024 * 1024
+# Defaults of the search server.
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8765
+SEARCH_RESULT_COUNT = 5
+# Seconds a query waits for others to share its embedding batch.
+SERVE_BATCH_DELAY = 0.005
+# Largest request body the server reads, in bytes.
+SERVE_MAX_BODY_SIZE = 1024 * 1024
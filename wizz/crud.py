@@ -1,14 +1,27 @@
-from collections.abc import Iterable
+import re
+from collections.abc import AsyncIterator
+from collections.abc import Sequence
 from functools import wraps
+from typing import NamedTuple
 
 from sqlalchemy import func
+from sqlalchemy import Row
+from sqlalchemy import Select
 from sqlalchemy import select
+from sqlalchemy import Table
+from sqlalchemy import update
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from wizz import constants
+from wizz.blob_cache import BlobCache
 from wizz.models import base
 from wizz.models import knowledge
 
+_blob_cache = BlobCache(constants.BLOB_CACHE_SIZE)
+# Words without letters or digits have no tokens to search.
+_WORD_CHARACTER = re.compile(r'[^\W_]')
+
 
 def optional_commit(crud_function):
     """Decorator to optionally commit the session after the function call."""
@@ -51,6 +64,7 @@ async def cascade_delete_context(
     context: knowledge.Context,
 ) -> None:
     """Delete a Context and all its associated Sources and Blobs."""
+    clear_blob_cache()
     await session.execute(
         knowledge.Blob.__table__.delete().where(
             knowledge.Blob.source_id.in_(
@@ -93,63 +107,160 @@ async def remove_all_links_for(
 
 
 @optional_commit
-async def create_source(
+async def remove_links_of_unindexed_sources(
     session: AsyncSession,
     *,
     context: knowledge.Context,
-    name: str,
-    content_hash: str,
-    vector_hex: str,
-) -> knowledge.Source:
-    """Create a new Source."""
-    source_instance = knowledge.Source(
-        context=context,
-        name=name,
-        hash=content_hash,
-        vector_hex=vector_hex,
+) -> None:
+    """Remove Links originating from the unindexed Sources of a Context."""
+    blob_ids = select(knowledge.Blob.id).join(
+        knowledge.Source,
+        knowledge.Blob.source_id == knowledge.Source.id,
+    ).filter(
+        knowledge.Source.context_id == context.id,
+        knowledge.Source.indexed_at.is_(None),
+    )
+    await session.execute(
+        knowledge.Link.__table__.delete().where(
+            knowledge.Link.blob_id.in_(blob_ids),
+        ),
     )
-    session.add(source_instance)
-    return source_instance
 
 
 @optional_commit
-async def create_blob(
+async def mark_sources_indexed(
     session: AsyncSession,
     *,
-    source: knowledge.Source,
-    text: str,
-    index: int,
-    vector_hex: str,
-) -> knowledge.Blob:
-    """Create a new Blob record."""
-    blob_instance = knowledge.Blob(
-        source=source,
-        text=text,
-        blob_index=index,
-        vector_hex=vector_hex,
+    source_ids: Sequence[int],
+) -> None:
+    """Mark the given Sources as indexed now."""
+    for start in range(0, len(source_ids), constants.LOOKUP_SIZE):
+        await session.execute(
+            update(knowledge.Source).where(
+                knowledge.Source.id.in_(
+                    source_ids[start:start + constants.LOOKUP_SIZE],
+                ),
+            ).values(indexed_at=func.now()),
+        )
+
+
+@optional_commit
+async def set_source_vector(
+    session: AsyncSession,
+    *,
+    source_id: int,
+    vector: bytes,
+) -> None:
+    """Replace the vector of a Source."""
+    await session.execute(
+        update(knowledge.Source).where(
+            knowledge.Source.id == source_id,
+        ).values(vector=vector),
     )
-    session.add(blob_instance)
-    return blob_instance
 
 
 @optional_commit
-async def create_link(
+async def reset_index_state(
     session: AsyncSession,
     *,
-    blob: knowledge.Blob,
-    target_source: knowledge.Source,
-    origin_distance: float,
-    destination_distance: float,
-) -> knowledge.Link:
-    """Create a new Link record."""
-    link_instance = knowledge.Link(
-        blob=blob,
-        target_source=target_source,
-        origin_distance=origin_distance,
-        destination_distance=destination_distance,
+    context: knowledge.Context,
+) -> None:
+    """Mark all Sources of a Context as unindexed."""
+    await session.execute(
+        update(knowledge.Source).where(
+            knowledge.Source.context_id == context.id,
+        ).values(indexed_at=None),
     )
-    session.add(link_instance)
-    return link_instance
+
+
+async def bulk_create_sources(
+    session: AsyncSession,
+    *,
+    rows: Sequence[dict],
+    batch_size: int = constants.BULK_INSERT_SIZE,
+    commit: bool = True,
+) -> list[int]:
+    """Insert plain Source rows in batches and return their IDs in order."""
+    return await _bulk_insert(
+        session,
+        table=knowledge.Source.__table__,
+        rows=rows,
+        batch_size=batch_size,
+        commit=commit,
+    )
+
+
+async def bulk_create_blobs(
+    session: AsyncSession,
+    *,
+    rows: Sequence[dict],
+    batch_size: int = constants.BULK_INSERT_SIZE,
+    commit: bool = True,
+    return_ids: bool = True,
+) -> list[int]:
+    """Insert plain Blob rows in batches and return their IDs in order.
+
+    Skipping the IDs inserts a batch in one statement instead of
+    one per row.
+    """
+    return await _bulk_insert(
+        session,
+        table=knowledge.Blob.__table__,
+        rows=rows,
+        batch_size=batch_size,
+        commit=commit,
+        return_ids=return_ids,
+    )
+
+
+async def bulk_create_links(
+    session: AsyncSession,
+    *,
+    rows: Sequence[dict],
+    batch_size: int = constants.BULK_INSERT_SIZE,
+    commit: bool = True,
+) -> None:
+    """Insert plain Link rows in batches."""
+    await _bulk_insert(
+        session,
+        table=knowledge.Link.__table__,
+        rows=rows,
+        batch_size=batch_size,
+        commit=commit,
+        return_ids=False,
+    )
+
+
+async def _bulk_insert(  # noqa: WPS211
+    session: AsyncSession,
+    *,
+    table: Table,
+    rows: Sequence[dict],
+    batch_size: int,
+    commit: bool,
+    return_ids: bool = True,
+) -> list[int]:
+    """Insert rows with Core executemany, bypassing the ORM.
+
+    Commits after every batch if asked to.
+    """
+    statement = table.insert()
+    if return_ids:
+        statement = statement.returning(
+            table.c.id,
+            sort_by_parameter_order=True,
+        )
+    inserted_ids: list[int] = []
+    for start in range(0, len(rows), batch_size):
+        query_result = await session.execute(
+            statement,
+            rows[start:start + batch_size],
+        )
+        if return_ids:
+            inserted_ids.extend(query_result.scalars())
+        if commit:
+            await session.commit()
+    return inserted_ids
 
 
 # This is pretty dumb, but I want to avoid using naked session.execute
@@ -174,71 +285,343 @@ async def count_objects(
     )
 
 
-async def stream_sources(
+async def summarize_source_ids(
     session: AsyncSession,
     *,
     context: knowledge.Context,
-) -> Iterable[knowledge.Source]:
-    """List all Sources in a given Context."""
-    query_result = await session.execute(
+) -> tuple[int, int]:
+    """Count the Sources in a given Context and find their largest ID.
+
+    The largest ID is zero if the Context has no Sources.
+    """
+    summary = await session.execute(
         select(
-            knowledge.Source,
-        ).join(
-            knowledge.Context,
-            knowledge.Source.context_id == knowledge.Context.id,
+            func.count(knowledge.Source.id),
+            func.coalesce(func.max(knowledge.Source.id), 0),
         ).filter(
-            knowledge.Context.id == context.id,
+            knowledge.Source.context_id == context.id,
         ),
     )
-    return query_result.scalars()
+    return summary.one().tuple()
 
 
-async def stream_blobs(
+async def summarize_blob_ids(
     session: AsyncSession,
     *,
     context: knowledge.Context,
-) -> Iterable[knowledge.Blob]:
-    """List all Blobs in a given Context."""
-    query_result = await session.execute(
+) -> tuple[int, int]:
+    """Count the Blobs in a given Context and find their largest ID.
+
+    The largest ID is zero if the Context has no Blobs.
+    """
+    summary = await session.execute(
         select(
-            knowledge.Blob,
+            func.count(knowledge.Blob.id),
+            func.coalesce(func.max(knowledge.Blob.id), 0),
         ).join(
             knowledge.Source,
             knowledge.Blob.source_id == knowledge.Source.id,
+        ).filter(
+            knowledge.Source.context_id == context.id,
+        ),
+    )
+    return summary.one().tuple()
+
+
+async def get_unindexed_source_ids(
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+) -> list[int]:
+    """Get the IDs of the Sources in a given Context not indexed yet."""
+    source_ids = await session.scalars(
+        select(knowledge.Source.id).filter(
+            knowledge.Source.context_id == context.id,
+            knowledge.Source.indexed_at.is_(None),
+        ),
+    )
+    return list(source_ids)
+
+
+def stream_blob_sources(
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+    only_unindexed: bool = False,
+    partition_size: int = constants.READ_PARTITION_SIZE,
+) -> AsyncIterator[Sequence[Row]]:
+    """Stream the ids of Blobs in a Context with their Source ids.
+
+    Yields partitions of (blob id, source id) rows ordered by Source.
+    Streams only the Blobs of unindexed Sources if asked to.
+    """
+    query = select(
+        knowledge.Blob.id,
+        knowledge.Blob.source_id,
+    ).join(
+        knowledge.Source,
+        knowledge.Blob.source_id == knowledge.Source.id,
+    ).filter(
+        knowledge.Source.context_id == context.id,
+    )
+    if only_unindexed:
+        query = query.filter(knowledge.Source.indexed_at.is_(None))
+    return _stream_partitions(
+        session,
+        query.order_by(knowledge.Blob.source_id, knowledge.Blob.id),
+        partition_size=partition_size,
+    )
+
+
+def stream_source_vectors(
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+    partition_size: int = constants.READ_PARTITION_SIZE,
+) -> AsyncIterator[Sequence[Row]]:
+    """Stream the ids and vectors of all Sources in a Context.
+
+    Yields partitions of (id, vector) rows ordered by id.
+    """
+    return _stream_partitions(
+        session,
+        select(
+            knowledge.Source.id,
+            knowledge.Source.vector,
+        ).filter(
+            knowledge.Source.context_id == context.id,
+        ).order_by(
+            knowledge.Source.id,
+        ),
+        partition_size=partition_size,
+    )
+
+
+def stream_blob_vectors(
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+    partition_size: int = constants.READ_PARTITION_SIZE,
+) -> AsyncIterator[Sequence[Row]]:
+    """Stream the ids and vectors of all Blobs in a Context.
+
+    Yields partitions of (id, vector) rows ordered by id.
+    """
+    return _stream_partitions(
+        session,
+        select(
+            knowledge.Blob.id,
+            knowledge.Blob.vector,
         ).join(
-            knowledge.Context,
-            knowledge.Source.context_id == knowledge.Context.id,
+            knowledge.Source,
+            knowledge.Blob.source_id == knowledge.Source.id,
         ).filter(
-            knowledge.Context.id == context.id,
+            knowledge.Source.context_id == context.id,
+        ).order_by(
+            knowledge.Blob.id,
+        ),
+        partition_size=partition_size,
+    )
+
+
+def stream_source_blob_vectors(
+    session: AsyncSession,
+    *,
+    source_id: int,
+    partition_size: int = constants.READ_PARTITION_SIZE,
+) -> AsyncIterator[Sequence[Row]]:
+    """Stream the ids and vectors of the Blobs of a Source.
+
+    Yields partitions of (id, vector) rows ordered by id.
+    """
+    return _stream_partitions(
+        session,
+        select(
+            knowledge.Blob.id,
+            knowledge.Blob.vector,
+        ).filter(
+            knowledge.Blob.source_id == source_id,
+        ).order_by(
+            knowledge.Blob.id,
         ),
+        partition_size=partition_size,
+    )
+
+
+async def _stream_partitions(
+    session: AsyncSession,
+    query: Select,
+    *,
+    partition_size: int,
+) -> AsyncIterator[Sequence[Row]]:
+    """Stream plain rows of a query in partitions of a fixed size.
+
+    Rows are fetched from a server-side cursor and bypass the ORM.
+    """
+    query_result = await session.stream(
+        query.execution_options(yield_per=partition_size),
     )
-    return query_result.scalars()
+    async for partition in query_result.partitions():
+        yield partition
+
 
+class RetrievedBlob(NamedTuple):
+    """A blob found by a search, with its source and its distance."""
 
-async def load_set_of_blobs(
+    blob_id: int
+    text: str
+    blob_index: int
+    source_name: str
+    distance: float
+
+
+async def retrieve_ranked_blobs(  # noqa: WPS210
     session: AsyncSession,
     *,
+    ranked_blobs: Sequence[tuple[int, float]],
+) -> list[RetrievedBlob]:
+    """Load ranked Blobs by their IDs with their source names.
+
+    Keeps the order and the distances of the ranking. Blobs retrieved
+    recently come from a cache, and the rest from one joined query.
+    """
+    blob_ids = {blob_id for blob_id, _ in ranked_blobs}
+    blob_rows = _blob_cache.get_many(blob_ids)
+    missing_ids = blob_ids.difference(blob_rows)
+    if missing_ids:
+        loaded_rows = await _load_retrieved_rows(session, missing_ids)
+        _blob_cache.put_many(loaded_rows)
+        blob_rows.update((row.id, row) for row in loaded_rows)
+    return [
+        RetrievedBlob(
+            blob_id=blob_id,
+            text=blob_rows[blob_id].text,
+            blob_index=blob_rows[blob_id].blob_index,
+            source_name=blob_rows[blob_id].source_name,
+            distance=distance,
+        )
+        for blob_id, distance in ranked_blobs
+        if blob_id in blob_rows
+    ]
+
+
+async def _load_retrieved_rows(
+    session: AsyncSession,
     blob_ids: set[int],
-) -> list[knowledge.Blob]:
-    """Load a set of Blobs by their IDs."""
+) -> Sequence[Row]:
+    """Load the rows of Blobs by their IDs, joined with their sources."""
     query_result = await session.execute(
-        select(knowledge.Blob).filter(
-            knowledge.Blob.id.in_(blob_ids),
-        ).order_by(
-            knowledge.Blob.source_id,
+        select(
+            knowledge.Blob.id,
+            knowledge.Blob.text,
             knowledge.Blob.blob_index,
+            knowledge.Source.name.label('source_name'),
+        ).join(
+            knowledge.Blob.source,
+        ).filter(
+            knowledge.Blob.id.in_(blob_ids),
         ),
     )
-    return query_result.scalars().all()
+    return query_result.all()
+
+
+def clear_blob_cache() -> None:
+    """Forget the retrieved Blobs, whose IDs can be reused once deleted."""
+    _blob_cache.clear()
+
+
+async def search_blobs_lexically(
+    session: AsyncSession,
+    *,
+    context_name: str,
+    query: str,
+    n: int,  # noqa: WPS111
+) -> list[tuple[int, float]]:
+    """Rank the Blobs of a Context by the BM25 of their text to a query.
+
+    A blob matches if it has any word of the query, and lower scores
+    rank first, like distances.
+    """
+    match_expression = _to_match_expression(query)
+    if not match_expression:
+        return []
+    query_result = await session.execute(
+        select(
+            knowledge.Blob.id,
+            knowledge.blob_fts.c.rank,
+        ).join(
+            knowledge.blob_fts,
+            knowledge.blob_fts.c.rowid == knowledge.Blob.id,
+        ).join(
+            knowledge.Blob.source,
+        ).join(
+            knowledge.Source.context,
+        ).filter(
+            knowledge.blob_fts.c.blob_fts.op('MATCH')(match_expression),
+            knowledge.Context.name == context_name,
+        ).order_by(
+            knowledge.blob_fts.c.rank,
+        ).limit(n),
+    )
+    return [(blob_id, rank) for blob_id, rank in query_result]
+
+
+def _to_match_expression(query: str) -> str:
+    """Quote every word of a query as a phrase any of which can match.
+
+    Quoted, the punctuation of identifiers and error codes is split
+    by the tokenizer like in the indexed text, and never read as
+    FTS5 syntax.
+    """
+    return ' OR '.join(
+        '"{0}"'.format(word.replace('"', '""'))
+        for word in query.split()
+        if _WORD_CHARACTER.search(word)
+    )
 
 
-async def does_source_exist(
+async def load_blob_sources(
     session: AsyncSession,
     *,
-    hashstring: str,
-) -> bool:
-    """Check if a Source with the given hash exists."""
+    blob_ids: set[int],
+) -> dict[int, Row]:
+    """Load the index and the source name of Blobs by their IDs.
+
+    Looks the IDs up in chunks, so any number of them takes few queries.
+    """
+    ordered_ids = sorted(blob_ids)
+    blob_sources = {}
+    for start in range(0, len(ordered_ids), constants.LOOKUP_SIZE):
+        query_result = await session.execute(
+            select(
+                knowledge.Blob.id,
+                knowledge.Blob.blob_index,
+                knowledge.Source.name.label('source_name'),
+            ).join(
+                knowledge.Blob.source,
+            ).filter(
+                knowledge.Blob.id.in_(
+                    ordered_ids[start:start + constants.LOOKUP_SIZE],
+                ),
+            ),
+        )
+        blob_sources.update((row.id, row) for row in query_result)
+    return blob_sources
+
+
+async def filter_known_hashes(
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+    hashstrings: set[str],
+) -> set[str]:
+    """Return the hashes that already have a Source in a given Context."""
+    if not hashstrings:
+        return set()
     query_result = await session.execute(
-        select(knowledge.Source).filter_by(hash=hashstring),
+        select(knowledge.Source.hash).filter(
+            knowledge.Source.context_id == context.id,
+            knowledge.Source.hash.in_(hashstrings),
+        ),
     )
-    return query_result.scalar() is not None
+    return set(query_result.scalars())
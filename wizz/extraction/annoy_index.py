@@ -0,0 +1,133 @@
+import os
+from collections.abc import Callable
+from logging import getLogger
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from wizz.extraction.constants import ANNOY_METRIC
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.constants import INDEX_SEARCH_K
+from wizz.extraction.constants import VECTOR_INDEX_PATH
+from wizz.extraction.vector_store import Neighbours
+
+if TYPE_CHECKING:
+    import annoy
+
+    from wizz.extraction.vector_index import IndexBuildProfile
+
+logger = getLogger('wizz')
+
+
+class AnnoyIndex:
+    """A disk-based Annoy index of vectors.
+
+    A build writes to a temporary file that replaces the index at once,
+    so processes reading the previous index keep a consistent mapping.
+    """
+
+    def __init__(self, unique_name: str) -> None:
+        """Point to a named index, which does not have to exist yet."""
+        self.name = unique_name
+        self.path = os.path.join(VECTOR_INDEX_PATH, f'{unique_name}.ann')
+        self._index: 'annoy.AnnoyIndex | None' = None
+
+    def exists(self) -> bool:
+        """Check whether the index file was built."""
+        return os.path.exists(self.path)
+
+    def build(
+        self,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        *,
+        profile: 'IndexBuildProfile',
+        on_added: Callable[[int], None],
+    ) -> None:
+        """Replace the index with a new one of the given vectors."""
+        logger.info('Building %s with %s.', self.name, profile)
+        building_path = f'{self.path}.building'
+        _build_file(
+            building_path,
+            ids,
+            vectors,
+            profile=profile,
+            on_added=on_added,
+        )
+        os.replace(building_path, self.path)
+        self._index = None
+
+    def get_ranked_neighbours_for(
+        self,
+        *,
+        vector: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = INDEX_SEARCH_K,
+    ) -> Neighbours:
+        """Get the n closest items to a vector, sorted by distance.
+
+        Inspects up to search_k nodes, which trades speed for recall.
+        """
+        ids, distances = self._load().get_nns_by_vector(
+            vector,
+            n,
+            search_k=search_k,
+            include_distances=True,
+        )
+        return list(zip(ids, distances))
+
+    def get_ranked_neighbours_for_many(
+        self,
+        *,
+        vectors: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = INDEX_SEARCH_K,
+    ) -> list[Neighbours]:
+        """Get the n closest items to every vector, one vector at a time."""
+        return [
+            self.get_ranked_neighbours_for(
+                vector=vector,
+                n=n,
+                search_k=search_k,
+            )
+            for vector in vectors
+        ]
+
+    def remove(self) -> None:
+        """Delete the file of the index."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self) -> 'annoy.AnnoyIndex':
+        """Map the index file into memory on first use."""
+        import annoy  # noqa: WPS433, WPS442
+
+        if self._index is None:
+            if not self.exists():
+                raise ValueError(f'Index {self.path} does not exist.')
+            self._index = annoy.AnnoyIndex(EMBEDDING_DIM, ANNOY_METRIC)
+            self._index.load(self.path)
+        return self._index
+
+
+def _build_file(
+    path: str,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    *,
+    profile: 'IndexBuildProfile',
+    on_added: Callable[[int], None],
+) -> None:
+    """Build an Annoy index of vectors into a file."""
+    import annoy  # noqa: WPS433, WPS442
+
+    index = annoy.AnnoyIndex(EMBEDDING_DIM, ANNOY_METRIC)
+    if profile.on_disk_build:
+        index.on_disk_build(path)
+    for stored_id, vector in zip(ids, vectors):
+        index.add_item(int(stored_id), vector)
+        on_added(1)
+    index.build(profile.trees, n_jobs=profile.jobs)
+    if not profile.on_disk_build:
+        index.save(path)
+    index.unload()
@@ -1,17 +1,40 @@
 from collections.abc import Generator
+from collections.abc import Iterable
+from collections.abc import Sequence
+from functools import cache
 from logging import getLogger
+from typing import TYPE_CHECKING
 
-import tiktoken
+import numpy as np
 
 from wizz.extraction.constants import CHUNK_OVERLAP
 from wizz.extraction.constants import CHUNK_SIZE
+from wizz.extraction.constants import TOKENIZER_MODEL
+from wizz.interface.types import TextChunk
+from wizz.interface.types import TokenIds
 
+if TYPE_CHECKING:
+    import tiktoken
+    import tokenizers
 
 logger = getLogger('wizz')
 
+_UTF8_CONTINUATION_MASK = 0xC0
+_UTF8_CONTINUATION_BYTE = 0x80
+# Text without a safe split point is tokenized anyway past this length.
+_MAX_PENDING_CHARACTERS = 1024 * 1024
+
+
+@cache
+def get_tokenizer() -> 'tiktoken.Encoding':
+    """Return the tokenizer shared by all batchers."""
+    import tiktoken  # noqa: WPS433, WPS442
+
+    return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+
 
 class TextBatcher:
-    """Normalize string iterable to token-chunked batches with overlap."""
+    """Normalize a text to token-chunked batches with overlap."""
 
     def __init__(
         self,
@@ -19,35 +42,319 @@ class TextBatcher:
         chunk_size_in_tokens: int = CHUNK_SIZE,
         chunk_overlap_in_tokens: int = CHUNK_OVERLAP,
     ) -> None:
-        """Initializes the batcher with an iterable of strings."""
-        logger.info('Initializing TextBatcher.')
-        self.start_character_index = 0
-        self.separator = ''
-        self.buffer = text
-        self.tokenizer = tiktoken.encoding_for_model('gpt-4')
+        """Initializes the batcher with a text."""
+        if chunk_overlap_in_tokens >= chunk_size_in_tokens:
+            raise ValueError('Chunk overlap must be less than chunk size.')
+        self.text = text
+        self.tokenizer = get_tokenizer()
         self.chunk_size = chunk_size_in_tokens
         self.chunk_overlap = chunk_overlap_in_tokens
 
-    def __iter__(self) -> Generator[tuple[int, str], None, None]:
+    def __iter__(  # noqa: WPS210
+        self,
+    ) -> Generator[tuple[int, str], None, None]:
+        """Yield pairs of batch start indices and token-chunked text.
+
+        The text is tokenized once, and every chunk is sliced
+        from the original text by its exact character offsets.
+        """
+        tokens = self.tokenizer.encode_ordinary(self.text)
+        if not tokens:
+            return
+        window_starts, window_stops = self._token_windows(len(tokens))
+        byte_offsets = self._byte_offsets(tokens)
+        start_indices, stop_indices = _to_character_offsets(
+            self.text,
+            byte_offsets[window_starts],
+            byte_offsets[window_stops],
+        )
+        yield from (
+            (start, self.text[start:stop])
+            for start, stop in zip(start_indices, stop_indices)
+        )
+
+    def _token_windows(
+        self,
+        token_count: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return start and stop token indices of overlapping windows."""
+        window_starts = np.arange(
+            0,
+            max(token_count - self.chunk_overlap, 1),
+            self.chunk_size - self.chunk_overlap,
+        )
+        window_stops = np.minimum(window_starts + self.chunk_size, token_count)
+        return window_starts, window_stops
+
+    def _byte_offsets(self, tokens: list[int]) -> np.ndarray:
+        """Return the byte offset of every token and of the text end."""
+        unique_tokens, token_positions = np.unique(
+            np.asarray(tokens, dtype=np.int64),
+            return_inverse=True,
+        )
+        token_lengths = np.array(
+            [
+                len(self.tokenizer.decode_single_token_bytes(token))
+                for token in unique_tokens.tolist()
+            ],
+            dtype=np.int64,
+        )
+        byte_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(token_lengths[token_positions], out=byte_offsets[1:])
+        return byte_offsets
+
+
+class StreamingTextBatcher(TextBatcher):  # noqa: WPS214, WPS230
+    """Chunk a stream of text pieces the way TextBatcher chunks a text.
+
+    Holds about one window of text and tokens, plus the piece being
+    read, so a text of any size can be chunked. Pieces are tokenized
+    up to the last line break before a non-space character, which the
+    tokenizer never merges across, so the chunks and their offsets
+    match the ones of the whole text.
+    """
+
+    def __init__(
+        self,
+        pieces: Iterable[str],
+        chunk_size_in_tokens: int = CHUNK_SIZE,
+        chunk_overlap_in_tokens: int = CHUNK_OVERLAP,
+    ) -> None:
+        """Initializes the batcher with an iterable of text pieces."""
+        super().__init__('', chunk_size_in_tokens, chunk_overlap_in_tokens)
+        self.pieces = pieces
+        self._reset()
+
+    def __iter__(self) -> Generator[TextChunk, None, None]:
         """Yield pairs of batch start indices and token-chunked text."""
-        while True:
-            tokens = self.tokenizer.encode(self.buffer)
-            has_enough_tokens = len(tokens) >= self.chunk_size
-            if not has_enough_tokens:
-                break
-            current_chunk_tokens, new_buffer = self._split_buffer(tokens)
-            self.buffer = new_buffer
-            batch = self.tokenizer.decode(current_chunk_tokens)
-            yield self.start_character_index, batch
-            self.start_character_index += len(batch)
-
-        if self.buffer:
-            yield self.start_character_index, self.buffer
-
-    def _split_buffer(self, tokens: list) -> tuple[list, str]:
-        """Splits the buffer into a chunk and a remainder."""
-        split_point = self.chunk_size - self.chunk_overlap
-        current_chunk_tokens = tokens[:self.chunk_size]
-        remaining_tokens = tokens[split_point:]
-        buffer = self.tokenizer.decode(remaining_tokens)
-        return current_chunk_tokens, buffer
+        self._reset()
+        for piece in self.pieces:
+            self._drop_popped()
+            self._buffer += piece
+            self._tokenize_up_to(self._find_split_point())
+            while self._pending_tokens() >= self.chunk_size:
+                yield self._pop_window()
+        self._tokenize_up_to(len(self._buffer))
+        while self._has_last_window():
+            yield self._pop_window()
+
+    def _reset(self) -> None:
+        """Forget the text read so far."""
+        self._buffer = ''
+        self._buffer_offset = 0
+        self._tokenized_end = 0
+        # Character offsets of the tokens in the buffer, where tokens
+        # start, rounded down, and where the previous tokens stop.
+        self._token_starts = np.empty(0, dtype=np.int64)
+        self._token_stops = np.empty(0, dtype=np.int64)
+        # The first token of the next window. Tokens and text before it
+        # are dropped at once when the next piece is read.
+        self._first_token = 0
+        self._has_windows = False
+
+    def _find_split_point(self) -> int:
+        """Find up to where the buffer can be tokenized without what follows.
+
+        That is right after the last line break followed by a non-space
+        character. Text without one is split at its end once it grows
+        too long, so memory stays bounded for texts without line breaks.
+        """
+        buffer_end = len(self._buffer)
+        position = self._buffer.rfind('\n', self._tokenized_end, buffer_end - 1)
+        while position >= self._tokenized_end:
+            if not self._buffer[position + 1].isspace():
+                return position + 1
+            position = self._buffer.rfind('\n', self._tokenized_end, position)
+        if buffer_end - self._tokenized_end > _MAX_PENDING_CHARACTERS:
+            return buffer_end
+        return self._tokenized_end
+
+    def _has_last_window(self) -> bool:
+        """Check if a window starts in the tokens left at the end.
+
+        Like TextBatcher, a text shorter than the overlap still
+        gets a single window.
+        """
+        if not self._has_windows:
+            return bool(self._pending_tokens())
+        return self._pending_tokens() > self.chunk_overlap
+
+    def _pending_tokens(self) -> int:
+        """Count the tokens from the start of the next window on."""
+        return max(len(self._token_starts) - self._first_token, 0)
+
+    def _tokenize_up_to(self, end: int) -> None:
+        """Tokenize the buffered text up to an offset."""
+        segment = self._buffer[self._tokenized_end:end]
+        tokens = self.tokenizer.encode_ordinary(segment)
+        byte_starts = self._byte_offsets(tokens)[:-1]
+        token_starts, token_stops = _to_character_offsets(
+            segment,
+            byte_starts,
+            byte_starts,
+        )
+        self._token_starts = np.concatenate([
+            self._token_starts,
+            np.asarray(token_starts, dtype=np.int64) + self._tokenized_end,
+        ])
+        self._token_stops = np.concatenate([
+            self._token_stops,
+            np.asarray(token_stops, dtype=np.int64) + self._tokenized_end,
+        ])
+        self._tokenized_end = max(end, self._tokenized_end)
+
+    def _pop_window(self) -> TextChunk:
+        """Take the first window and move on to the next one.
+
+        Only moves the cursor, so popping a window copies nothing
+        but the text of the window.
+        """
+        first = self._first_token
+        start = int(self._token_starts[first])
+        stop = self._tokenized_end
+        if self._pending_tokens() > self.chunk_size:
+            stop = int(self._token_stops[first + self.chunk_size])
+        self._has_windows = True
+        self._first_token += self.chunk_size - self.chunk_overlap
+        return self._buffer_offset + start, self._buffer[start:stop]
+
+    def _drop_popped(self) -> None:
+        """Drop the text and the tokens before the next window."""
+        cut = self._tokenized_end
+        if self._first_token < len(self._token_starts):
+            cut = int(self._token_starts[self._first_token])
+        self._buffer = self._buffer[cut:]
+        self._buffer_offset += cut
+        self._tokenized_end -= cut
+        self._token_starts = self._token_starts[self._first_token:] - cut
+        self._token_stops = self._token_stops[self._first_token:] - cut
+        self._first_token = 0
+
+
+class ModelBatcher:
+    """Split a text into windows of the embedding model's own tokens.
+
+    Every window fits the model's maximum sequence length together
+    with its special tokens, so the model sees all of it, and comes
+    with its token ids, so it is never tokenized again.
+    """
+
+    def __init__(self, text: str, tokenizer: 'tokenizers.Tokenizer') -> None:
+        """Initializes the batcher with a text and a windowing tokenizer."""
+        self.text = text
+        self.tokenizer = tokenizer
+
+    def __iter__(self) -> Generator[tuple[TextChunk, TokenIds], None, None]:
+        """Yield token-windowed chunks with the token ids of each."""
+        encoding = self.tokenizer.encode(self.text)
+        for window in (encoding, *encoding.overflowing):
+            content_offsets = np.array(window.offsets)[
+                np.logical_not(window.special_tokens_mask)
+            ]
+            if not content_offsets.size:
+                continue
+            start = int(content_offsets[0, 0])
+            stop = int(content_offsets[-1, 1])
+            yield (start, self.text[start:stop]), window.ids
+
+
+class StreamingModelBatcher:
+    """Split a stream of text pieces into windows of model tokens.
+
+    The text read so far is windowed up to its last line break,
+    so only about a piece of text is held at once. Windows do not
+    overlap across those line breaks, so a few chunks differ from
+    the ones of the whole text.
+    """
+
+    def __init__(
+        self,
+        pieces: Iterable[str],
+        tokenizer: 'tokenizers.Tokenizer',
+    ) -> None:
+        """Initializes the batcher with text pieces and a tokenizer."""
+        self.pieces = pieces
+        self.tokenizer = tokenizer
+
+    def __iter__(self) -> Generator[tuple[TextChunk, TokenIds], None, None]:
+        """Yield token-windowed chunks with the token ids of each."""
+        buffer = ''
+        buffer_offset = 0
+        for piece in self.pieces:
+            buffer += piece
+            split_point = buffer.rfind('\n') + 1
+            if not split_point and len(buffer) > _MAX_PENDING_CHARACTERS:
+                split_point = len(buffer)
+            yield from self._window(buffer[:split_point], buffer_offset)
+            buffer = buffer[split_point:]
+            buffer_offset += split_point
+        yield from self._window(buffer, buffer_offset)
+
+    def _window(
+        self,
+        text: str,
+        offset: int,
+    ) -> Generator[tuple[TextChunk, TokenIds], None, None]:
+        """Window a part of the text that starts at an offset."""
+        yield from (
+            ((offset + start, chunk), token_ids)
+            for (start, chunk), token_ids in ModelBatcher(text, self.tokenizer)
+        )
+
+
+def load_model_tokenizer(
+    tokenizer_json: str,
+    max_seq_length: int,
+    chunk_overlap_in_tokens: int = CHUNK_OVERLAP,
+) -> 'tokenizers.Tokenizer':
+    """Build a tokenizer that splits texts into overlapping model windows.
+
+    Windows longer than the maximum sequence length overflow into
+    the next window instead of being truncated.
+    """
+    import tokenizers  # noqa: WPS433, WPS442
+
+    tokenizer = tokenizers.Tokenizer.from_str(tokenizer_json)
+    tokenizer.no_padding()
+    tokenizer.enable_truncation(
+        max_seq_length,
+        stride=chunk_overlap_in_tokens,
+    )
+    return tokenizer
+
+
+def pad_token_ids(token_ids: Sequence[TokenIds]) -> dict[str, np.ndarray]:
+    """Pad token ids of several sections into model inputs."""
+    longest = max(len(section_ids) for section_ids in token_ids)
+    input_ids = np.zeros((len(token_ids), longest), dtype=np.int64)
+    attention_mask = np.zeros_like(input_ids)
+    for row, section_ids in enumerate(token_ids):
+        input_ids[row, :len(section_ids)] = section_ids
+        attention_mask[row, :len(section_ids)] = 1
+    return {
+        'input_ids': input_ids,
+        'attention_mask': attention_mask,
+        'token_type_ids': np.zeros_like(input_ids),
+    }
+
+
+def _to_character_offsets(
+    text: str,
+    byte_starts: np.ndarray,
+    byte_stops: np.ndarray,
+) -> tuple[list[int], list[int]]:
+    """Map byte offsets in a text to the character offsets that cover them.
+
+    A token can end in the middle of a multibyte character,
+    so starts are rounded down and stops are rounded up.
+    """
+    utf8_bytes = np.frombuffer(
+        text.encode('utf-8', errors='surrogatepass'),
+        dtype=np.uint8,
+    )
+    character_starts = np.flatnonzero(
+        utf8_bytes & _UTF8_CONTINUATION_MASK != _UTF8_CONTINUATION_BYTE,
+    )
+    starts = np.searchsorted(character_starts, byte_starts, side='right')
+    stops = np.searchsorted(character_starts, byte_stops, side='left')
+    return (starts - 1).tolist(), stops.tolist()
@@ -7,12 +7,29 @@ PHI = (1 + math.sqrt(5)) / 2
 EMBEDDING_CACHE_PATH = 'embeddings_cache'
 EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
 EMBEDDING_DIM = 384
+EMBEDDING_BATCH_SIZE = 64
+ONNX_MIN_COSINE_AGREEMENT = 0.98
 
 ANNOY_METRIC = 'angular'
 ANNOY_INDICES_STORE_PATH = 'annoy_indices'
+ANNOY_TREES = 10
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# -1 means all CPU cores for jobs, and the index default for search_k.
+INDEX_BUILD_JOBS = -1
+INDEX_SEARCH_K = -1
+VECTOR_INDEX_PATH = 'vector_indices'
+# Indices up to this size are searched exactly, from this size with HNSW.
+EXACT_INDEX_MAX_SIZE = 20000
+HNSW_MIN_SIZE = 1000000
+VECTOR_STORE_PATH = 'vector_store'
+VECTOR_CACHE_PATH = 'vector_cache.db'
+VECTOR_CACHE_SIZE = 250000
 
 DTYPE = np.float32
 
 
+TOKENIZER_MODEL = 'gpt-4'
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = int(CHUNK_SIZE // PHI ** 6)
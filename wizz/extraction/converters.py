@@ -1,19 +1,29 @@
+from numpy import float16
 from numpy import float32
 from numpy import frombuffer
 from numpy import ndarray
+from numpy.typing import DTypeLike
 
+from wizz.extraction.constants import EMBEDDING_DIM
 
-def vector_to_hex(vector: ndarray) -> str:
-    """Converts a numpy array to a hexadecimal string."""
-    return vector.tobytes().hex()
 
+def vector_to_bytes(
+    vector: ndarray,
+    dtype: DTypeLike = float32,
+) -> bytes:
+    """Converts a numpy array to raw bytes of a given precision."""
+    return vector.astype(dtype, copy=False).tobytes()
 
-def hex_to_vector(
-    hex_str: str,
-    dtype: type = float32,
-) -> ndarray:
-    """Converts a hexadecimal string to a numpy array."""
-    return frombuffer(bytes.fromhex(hex_str), dtype=dtype)
+
+def bytes_to_vector(buffer: bytes) -> ndarray:
+    """Converts raw bytes to a float32 numpy array.
+
+    The stored precision is told apart by the buffer size.
+    Single precision vectors are read without copying.
+    """
+    if len(buffer) == EMBEDDING_DIM * float16().itemsize:
+        return frombuffer(buffer, dtype=float16).astype(float32)
+    return frombuffer(buffer, dtype=float32)
 
 
 def to_blob_ix_name(context_name: str) -> str:
@@ -1,31 +1,152 @@
+from collections.abc import Callable
+from collections.abc import Sequence
 from logging import getLogger
-from typing import cast
 
-from numpy import ndarray
-from sentence_transformers import SentenceTransformer
+import numpy as np
 
-from wizz.extraction.constants import EMBEDDING_CACHE_PATH
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.constants import EMBEDDING_DIM
 from wizz.extraction.constants import EMBEDDING_MODEL
+from wizz.extraction.embedding_cache import EmbeddingCache
+from wizz.extraction.embedding_cache import encode_through_cache
+from wizz.extraction.embedding_cache import tokenized_cache_key
+from wizz.extraction.onnx_model import QuantizedOnnxModel
+from wizz.extraction.torch_model import TorchModel
+from wizz.interface.enums import EmbeddingBackend
+from wizz.interface.types import TokenIds
 
 logger = getLogger('wizz')
 
 
-class Embedder(SentenceTransformer):
-    """Embedding model with type and option overrides."""
+class Embedder:  # noqa: WPS214
+    """Embedding model with type and option overrides.
 
-    def __init__(self):
-        """Initialize without options."""
-        logger.info('Initializing embedder with model: %s', EMBEDDING_MODEL)
-        super().__init__(
+    Sections that were embedded before are read from the embedding
+    cache instead of going through the model again.
+
+    The torch backend runs the original model. The onnx_int8 backend
+    runs it with int8 weights; its vectors keep a cosine similarity
+    of at least ONNX_MIN_COSINE_AGREEMENT to the torch ones, so they
+    can be searched against indices built with either backend.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        *,
+        use_cache: bool = True,
+        backend: EmbeddingBackend = EmbeddingBackend.torch,
+        threads: int | None = None,
+    ):
+        """Initialize with a fixed encoding batch size."""
+        logger.info(
+            'Initializing %s embedder with model: %s',
+            backend,
             EMBEDDING_MODEL,
-            cache_folder=EMBEDDING_CACHE_PATH,
+        )
+        self.model = _load_model(backend, threads)
+        self.batch_size = batch_size
+        self.cache = (
+            EmbeddingCache(get_model_id(backend)) if use_cache else None
         )
 
-    def __call__(self, section: str) -> ndarray:
+    def __call__(self, sections: str | Sequence[str]) -> np.ndarray:
         """Encode on call."""
-        return self.encode(section)
+        return self.encode(sections)
+
+    def encode(self, sections: str | Sequence[str]) -> np.ndarray:
+        """Encode a single section or a sequence of sections.
+
+        A single string gives a vector, a sequence gives a matrix
+        with one row per section in the original order.
+        """
+        if isinstance(sections, str):
+            return self.encode([sections])[0]
+        if self.cache is None:
+            return self._encode_uncached(sections)
+        return encode_through_cache(
+            sections,
+            cache=self.cache,
+            encode=self._encode_uncached,
+        )
+
+    @property
+    def tokenizer_spec(self) -> tuple[str, int]:
+        """Get the serialized tokenizer and the maximum sequence length."""
+        return self.model.tokenizer_json, self.model.max_seq_length
+
+    def encode_token_ids(
+        self,
+        token_ids: Sequence[TokenIds],
+        *,
+        sections: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        """Encode sections already tokenized by the model's own tokenizer.
+
+        The ids go to the model as they are; together with the section
+        texts they address the embedding cache, which is skipped
+        without the texts.
+        """
+        if self.cache is None or sections is None:
+            return self._encode_token_ids_uncached(token_ids)
+        cache_keys = [
+            tokenized_cache_key(section, section_ids)
+            for section, section_ids in zip(sections, token_ids)
+        ]
+        ids_by_key = dict(zip(cache_keys, token_ids))
+        return encode_through_cache(
+            cache_keys,
+            cache=self.cache,
+            encode=lambda missing: self._encode_token_ids_uncached(
+                [ids_by_key[cache_key] for cache_key in missing],
+            ),
+        )
+
+    def _encode_uncached(self, sections: Sequence[str]) -> np.ndarray:
+        """Run the model over the sections in length-sorted batches."""
+        logger.info('Encoding %s sections.', len(sections))
+        return self._encode_by_length(sections, self.model.encode)
+
+    def _encode_token_ids_uncached(
+        self,
+        token_ids: Sequence[TokenIds],
+    ) -> np.ndarray:
+        """Run the model over tokenized sections in length-sorted batches."""
+        logger.info('Encoding %s tokenized sections.', len(token_ids))
+        return self._encode_by_length(token_ids, self.model.encode_token_ids)
+
+    def _encode_by_length(
+        self,
+        sections: Sequence[str] | Sequence[TokenIds],
+        encode_batch: Callable[..., np.ndarray],
+    ) -> np.ndarray:
+        """Encode sections in batches of similar length."""
+        embeddings = np.empty((len(sections), EMBEDDING_DIM), dtype=DTYPE)
+        # Sections of similar length share a batch to minimize padding.
+        by_length = np.argsort(
+            [-len(section) for section in sections],
+            kind='stable',
+        )
+        for start in range(0, len(sections), self.batch_size):
+            batch_indices = by_length[start:start + self.batch_size]
+            embeddings[batch_indices] = encode_batch(
+                [sections[ix] for ix in batch_indices],
+                batch_size=self.batch_size,
+            )
+        return embeddings
+
+
+def get_model_id(backend: EmbeddingBackend) -> str:
+    """Name the model and the backend its vectors come from."""
+    return f'{EMBEDDING_MODEL}:{backend}'
+
 
-    def encode(self, section: str) -> ndarray:
-        """Only support string encodings into ndarrays."""
-        logger.info('Encoding section of length: %s', len(section))
-        return cast(ndarray, super().encode(section))
+def _load_model(
+    backend: EmbeddingBackend,
+    threads: int | None,
+) -> QuantizedOnnxModel | TorchModel:
+    """Load the embedding model for a backend."""
+    if backend == EmbeddingBackend.onnx_int8:
+        return QuantizedOnnxModel(EMBEDDING_MODEL, threads=threads)
+    return TorchModel(EMBEDDING_MODEL, threads=threads)
@@ -0,0 +1,187 @@
+import hashlib
+import sqlite3
+import time
+from collections.abc import Callable
+from collections.abc import Sequence
+from logging import getLogger
+
+import numpy as np
+
+from wizz.extraction import converters
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.constants import VECTOR_CACHE_PATH
+from wizz.extraction.constants import VECTOR_CACHE_SIZE
+from wizz.interface.types import TokenIds
+
+logger = getLogger('wizz')
+
+# SQLite limits the number of bound parameters in a single statement.
+_LOOKUP_SIZE = 500
+# Seconds to wait for another process writing to the cache.
+_BUSY_TIMEOUT = 30
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS embedding (
+    model TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    vector BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, digest)
+) WITHOUT ROWID
+"""
+_CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS ix_embedding_last_used ON embedding (last_used)
+"""
+_SELECT_VECTORS = """
+SELECT digest, vector FROM embedding
+WHERE model = ? AND digest IN ({placeholders})
+"""
+_TOUCH_VECTOR = """
+UPDATE embedding SET last_used = ? WHERE model = ? AND digest = ?
+"""
+_INSERT_VECTOR = """
+INSERT OR IGNORE INTO embedding (model, digest, vector, last_used)
+VALUES (?, ?, ?, ?)
+"""
+_EVICT_VECTORS = """
+DELETE FROM embedding WHERE (model, digest) IN (
+    SELECT model, digest FROM embedding ORDER BY last_used LIMIT ?
+)
+"""
+
+
+class EmbeddingCache:
+    """On-disk vectors of sections, addressed by model and content.
+
+    Keeps at most a fixed number of vectors and evicts the least
+    recently used ones first. Counts hits and misses of lookups.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        path: str = VECTOR_CACHE_PATH,
+        max_entries: int = VECTOR_CACHE_SIZE,
+    ) -> None:
+        """Open the cache file, creating it if needed."""
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Encoding may run on another thread than the one that opened it.
+        self._connection = sqlite3.connect(
+            path,
+            timeout=_BUSY_TIMEOUT,
+            check_same_thread=False,
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(_CREATE_TABLE)
+        self._connection.execute(_CREATE_INDEX)
+        self._entries = self._connection.execute(
+            'SELECT count(*) FROM embedding',
+        ).fetchone()[0]
+
+    def get_many(  # noqa: WPS210
+        self,
+        sections: Sequence[str],
+    ) -> dict[str, np.ndarray]:
+        """Look up cached vectors of sections and mark them as used."""
+        digests = {_to_digest(section): section for section in set(sections)}
+        found: dict[str, np.ndarray] = {}
+        found_digests = []
+        digest_list = list(digests)
+        for start in range(0, len(digest_list), _LOOKUP_SIZE):
+            lookup = digest_list[start:start + _LOOKUP_SIZE]
+            placeholders = ', '.join('?' * len(lookup))
+            found_rows = self._connection.execute(
+                _SELECT_VECTORS.format(placeholders=placeholders),
+                (self.model_name, *lookup),
+            )
+            for digest, vector in found_rows:
+                found[digests[digest]] = converters.bytes_to_vector(vector)
+                found_digests.append(digest)
+        with self._connection:
+            self._connection.executemany(
+                _TOUCH_VECTOR,
+                [
+                    (time.time_ns(), self.model_name, found_digest)
+                    for found_digest in found_digests
+                ],
+            )
+        self.hits += sum(section in found for section in sections)
+        self.misses += sum(section not in found for section in sections)
+        return found
+
+    def put_many(self, sections: Sequence[str], vectors: np.ndarray) -> None:
+        """Store vectors of sections, evicting the least recently used."""
+        now = time.time_ns()
+        with self._connection:
+            inserted = self._connection.executemany(
+                _INSERT_VECTOR,
+                [
+                    (
+                        self.model_name,
+                        _to_digest(section),
+                        converters.vector_to_bytes(vector),
+                        now,
+                    )
+                    for section, vector in zip(sections, vectors)
+                ],
+            )
+            self._entries += inserted.rowcount
+            if self._entries > self.max_entries:
+                self._evict(self._entries - self.max_entries)
+
+    def close(self) -> None:
+        """Close the cache file."""
+        self._connection.close()
+
+    def _evict(self, count: int) -> None:
+        """Delete a number of the least recently used vectors."""
+        logger.info('Evicting %s cached embeddings.', count)
+        evicted = self._connection.execute(_EVICT_VECTORS, (count,))
+        self._entries -= evicted.rowcount
+
+
+def encode_through_cache(  # noqa: WPS210
+    sections: Sequence[str],
+    *,
+    cache: EmbeddingCache,
+    encode: Callable[[Sequence[str]], np.ndarray],
+) -> np.ndarray:
+    """Encode only the sections that are not cached yet.
+
+    Repeated sections are encoded once, and new vectors are cached.
+    """
+    cached = cache.get_many(sections)
+    missing = list(dict.fromkeys(
+        section for section in sections if section not in cached
+    ))
+    if missing:
+        logger.info('Encoding %s uncached sections.', len(missing))
+        missing_vectors = encode(missing)
+        cache.put_many(missing, missing_vectors)
+        cached.update(zip(missing, missing_vectors))
+    embeddings = np.empty((len(sections), EMBEDDING_DIM), dtype=DTYPE)
+    for row, section in enumerate(sections):
+        embeddings[row] = cached[section]
+    return embeddings
+
+
+def tokenized_cache_key(section: str, token_ids: TokenIds) -> str:
+    """Address a tokenized section by its text and its token ids.
+
+    A text cut out of a longer one can have other ids than the same
+    text tokenized alone, and its vector follows the ids.
+    """
+    return '{0}\0{1}'.format(section, ' '.join(map(str, token_ids)))
+
+
+def _to_digest(section: str) -> bytes:
+    """Address a section by the hash of its content."""
+    return hashlib.sha1(
+        section.encode('utf-8', errors='surrogatepass'),
+        usedforsecurity=False,
+    ).digest()
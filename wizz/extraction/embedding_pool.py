@@ -0,0 +1,210 @@
+import math
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from logging import getLogger
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Self
+
+import numpy as np
+
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.constants import EMBEDDING_MODEL
+from wizz.extraction.embedder import Embedder
+from wizz.extraction.embedder import get_model_id
+from wizz.extraction.embedding_cache import EmbeddingCache
+from wizz.extraction.embedding_cache import encode_through_cache
+from wizz.extraction.embedding_cache import tokenized_cache_key
+from wizz.extraction.onnx_model import ensure_exported
+from wizz.interface.enums import EmbeddingBackend
+from wizz.interface.types import TokenIds
+
+logger = getLogger('wizz')
+
+# Each worker process holds its own model, loaded once on startup.
+_worker_embedder: Embedder | None = None
+
+
+class EmbeddingPool:  # noqa: WPS214
+    """Embedder drop-in that shards encoding across worker processes.
+
+    Workers write their vectors straight into a shared memory block,
+    so the results never pass through pickling. The embedding cache
+    is consulted here, so workers only get the sections it misses.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        *,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        use_cache: bool = True,
+        backend: EmbeddingBackend = EmbeddingBackend.torch,
+    ) -> None:
+        """Start the worker processes and load a model in each of them."""
+        logger.info('Starting %s embedding workers.', workers)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cache = (
+            EmbeddingCache(get_model_id(backend)) if use_cache else None
+        )
+        if backend == EmbeddingBackend.onnx_int8:
+            # Export once here rather than racing in every worker.
+            ensure_exported(EMBEDDING_MODEL)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=_initialize_worker,
+            initargs=(
+                batch_size,
+                backend,
+                max(1, (os.cpu_count() or 1) // workers),
+            ),
+        )
+
+    def __call__(self, sections: str | Sequence[str]) -> np.ndarray:
+        """Encode on call."""
+        return self.encode(sections)
+
+    def __enter__(self) -> Self:
+        """Use the pool as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        """Shut the workers down."""
+        self.close()
+
+    def encode(self, sections: str | Sequence[str]) -> np.ndarray:
+        """Encode a single section or a sequence of sections."""
+        if isinstance(sections, str):
+            return self.encode([sections])[0]
+        if self.cache is None:
+            return self._encode_uncached(sections)
+        return encode_through_cache(
+            sections,
+            cache=self.cache,
+            encode=self._encode_uncached,
+        )
+
+    @cached_property
+    def tokenizer_spec(self) -> tuple[str, int]:
+        """Get the serialized tokenizer and the maximum sequence length."""
+        return self._executor.submit(_get_tokenizer_spec).result()
+
+    def encode_token_ids(
+        self,
+        token_ids: Sequence[TokenIds],
+        *,
+        sections: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        """Encode sections already tokenized by the model's own tokenizer."""
+        if self.cache is None or sections is None:
+            return self._encode_uncached(token_ids, is_tokenized=True)
+        cache_keys = [
+            tokenized_cache_key(section, section_ids)
+            for section, section_ids in zip(sections, token_ids)
+        ]
+        ids_by_key = dict(zip(cache_keys, token_ids))
+        return encode_through_cache(
+            cache_keys,
+            cache=self.cache,
+            encode=lambda missing: self._encode_uncached(
+                [ids_by_key[cache_key] for cache_key in missing],
+                is_tokenized=True,
+            ),
+        )
+
+    def close(self) -> None:
+        """Shut the workers down."""
+        self._executor.shutdown()
+
+    def _encode_uncached(
+        self,
+        sections: Sequence[str] | Sequence[TokenIds],
+        *,
+        is_tokenized: bool = False,
+    ) -> np.ndarray:
+        """Encode sections in shards across the workers."""
+        rows = len(sections)
+        shard_size = max(self.batch_size, math.ceil(rows / self.workers))
+        shared_block = SharedMemory(
+            create=True,
+            size=max(rows * EMBEDDING_DIM * DTYPE().itemsize, 1),
+        )
+        try:  # noqa: WPS229, WPS501
+            shards = [
+                self._executor.submit(
+                    _encode_into,
+                    sections[offset:offset + shard_size],
+                    block_name=shared_block.name,
+                    offset=offset,
+                    rows=rows,
+                    is_tokenized=is_tokenized,
+                )
+                for offset in range(0, rows, shard_size)
+            ]
+            for shard in shards:
+                shard.result()
+            return _as_matrix(shared_block, rows).copy()
+        finally:
+            shared_block.close()
+            shared_block.unlink()
+
+
+def _initialize_worker(
+    batch_size: int,
+    backend: EmbeddingBackend,
+    threads: int,
+) -> None:
+    """Load the model once per worker process."""
+    global _worker_embedder  # noqa: WPS420
+    # Workers share the cores instead of each claiming all of them.
+    _worker_embedder = Embedder(  # noqa: WPS122, WPS442
+        batch_size=batch_size,
+        use_cache=False,
+        backend=backend,
+        threads=threads,
+    )
+
+
+def _get_tokenizer_spec() -> tuple[str, int]:
+    """Get the tokenizer spec of the model in a worker process."""
+    return _worker_embedder.tokenizer_spec  # type: ignore
+
+
+def _encode_into(
+    sections: Sequence[str] | Sequence[TokenIds],
+    *,
+    block_name: str,
+    offset: int,
+    rows: int,
+    is_tokenized: bool,
+) -> None:
+    """Encode a shard of sections into its rows of a shared block."""
+    encode = (
+        _worker_embedder.encode_token_ids  # type: ignore
+        if is_tokenized
+        else _worker_embedder
+    )
+    shared_block = SharedMemory(name=block_name)
+    try:  # noqa: WPS229, WPS501
+        matrix = _as_matrix(shared_block, rows)
+        matrix[offset:offset + len(sections)] = (  # noqa: WPS362
+            encode(sections)  # type: ignore
+        )
+        del matrix  # noqa: WPS420
+    finally:
+        shared_block.close()
+
+
+def _as_matrix(shared_block: SharedMemory, rows: int) -> np.ndarray:
+    """View a shared memory block as an embedding matrix."""
+    return np.ndarray(
+        shape=(rows, EMBEDDING_DIM),
+        dtype=DTYPE,
+        buffer=shared_block.buf,
+    )
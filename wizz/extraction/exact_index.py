@@ -0,0 +1,62 @@
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from wizz.extraction.constants import INDEX_SEARCH_K
+from wizz.extraction.vector_store import Neighbours
+from wizz.extraction.vector_store import VectorStore
+
+if TYPE_CHECKING:
+    from wizz.extraction.vector_index import IndexBuildProfile
+
+
+class ExactIndex:
+    """Brute-force search over the vector store of the same name.
+
+    Has nothing to build, since every query compares the vector
+    to all rows of the memory-mapped store.
+    """
+
+    def __init__(self, unique_name: str) -> None:
+        """Point to the store of a named index."""
+        self.name = unique_name
+        self.store = VectorStore(unique_name)
+
+    def exists(self) -> bool:
+        """Check whether the index can be queried, which it always can."""
+        return True
+
+    def build(
+        self,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        *,
+        profile: 'IndexBuildProfile',
+        on_added: Callable[[int], None],
+    ) -> None:
+        """Accept the vectors, which are already in the store."""
+        on_added(len(ids))
+
+    def get_ranked_neighbours_for(
+        self,
+        *,
+        vector: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = INDEX_SEARCH_K,
+    ) -> Neighbours:
+        """Get the n closest ids to a vector, ignoring search_k."""
+        return self.store.get_ranked_neighbours_for(vector=vector, n=n)
+
+    def get_ranked_neighbours_for_many(
+        self,
+        *,
+        vectors: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = INDEX_SEARCH_K,
+    ) -> list[Neighbours]:
+        """Get the n closest ids to every vector, ignoring search_k."""
+        return self.store.get_ranked_neighbours_for_many(vectors=vectors, n=n)
+
+    def remove(self) -> None:
+        """Keep the store, which belongs to the context, not the index."""
@@ -0,0 +1,130 @@
+import os
+from collections.abc import Callable
+from logging import getLogger
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from wizz.extraction import vector_store
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.constants import HNSW_EF_CONSTRUCTION
+from wizz.extraction.constants import HNSW_EF_SEARCH
+from wizz.extraction.constants import HNSW_M
+from wizz.extraction.constants import INDEX_SEARCH_K
+from wizz.extraction.constants import VECTOR_INDEX_PATH
+
+if TYPE_CHECKING:
+    import hnswlib
+
+    from wizz.extraction.vector_index import IndexBuildProfile
+
+logger = getLogger('wizz')
+
+# Vectors added to the graph at a time, between progress updates.
+_ADD_BATCH_SIZE = 10000
+
+
+class HnswIndex:
+    """A disk-based HNSW graph index of vectors, built with hnswlib.
+
+    Needs hnswlib installed, which is optional. A build writes to
+    a temporary file that replaces the index at once.
+    """
+
+    def __init__(self, unique_name: str) -> None:
+        """Point to a named index, which does not have to exist yet."""
+        self.name = unique_name
+        self.path = os.path.join(VECTOR_INDEX_PATH, f'{unique_name}.hnsw')
+        self._index: 'hnswlib.Index | None' = None
+
+    def exists(self) -> bool:
+        """Check whether the index file was built."""
+        return os.path.exists(self.path)
+
+    def build(
+        self,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        *,
+        profile: 'IndexBuildProfile',
+        on_added: Callable[[int], None],
+    ) -> None:
+        """Replace the index with a new one of the given vectors."""
+        import hnswlib  # noqa: WPS433, WPS442
+
+        logger.info('Building %s with %s.', self.name, profile)
+        index = hnswlib.Index(space='cosine', dim=EMBEDDING_DIM)
+        index.init_index(
+            max_elements=max(len(ids), 1),
+            M=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+        )
+        for start in range(0, len(ids), _ADD_BATCH_SIZE):
+            batch = slice(start, start + _ADD_BATCH_SIZE)
+            index.add_items(
+                vectors[batch],
+                ids[batch],
+                num_threads=profile.jobs,
+            )
+            on_added(len(ids[batch]))
+        building_path = f'{self.path}.building'
+        index.save_index(building_path)
+        os.replace(building_path, self.path)
+        self._index = None
+
+    def get_ranked_neighbours_for(
+        self,
+        *,
+        vector: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = INDEX_SEARCH_K,
+    ) -> vector_store.Neighbours:
+        """Get the n closest ids to a vector, sorted by angular distance.
+
+        Explores search_k candidates, which trades speed for recall.
+        """
+        return self.get_ranked_neighbours_for_many(
+            vectors=np.asarray(vector)[np.newaxis],
+            n=n,
+            search_k=search_k,
+        )[0]
+
+    def get_ranked_neighbours_for_many(  # noqa: WPS210
+        self,
+        *,
+        vectors: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = INDEX_SEARCH_K,
+    ) -> list[vector_store.Neighbours]:
+        """Get the n closest ids to every vector in one graph query."""
+        index = self._load()
+        n = min(n, index.get_current_count())  # noqa: WPS111
+        if not n:
+            return [[] for _ in vectors]
+        index.set_ef(max(HNSW_EF_SEARCH if search_k < 0 else search_k, n))
+        all_ids, all_distances = index.knn_query(vectors, k=n)
+        return [
+            list(
+                zip(
+                    ids.tolist(),
+                    vector_store.to_angular_distance(1 - distances).tolist(),
+                ),
+            )
+            for ids, distances in zip(all_ids, all_distances)
+        ]
+
+    def remove(self) -> None:
+        """Delete the file of the index."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self) -> 'hnswlib.Index':
+        """Load the index file on first use."""
+        import hnswlib  # noqa: WPS433, WPS442
+
+        if self._index is None:
+            if not self.exists():
+                raise ValueError(f'Index {self.path} does not exist.')
+            self._index = hnswlib.Index(space='cosine', dim=EMBEDDING_DIM)
+            self._index.load_index(self.path)
+        return self._index
@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Sequence
+from logging import getLogger
+
+import numpy as np
+
+from wizz.extraction.batcher import pad_token_ids
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_CACHE_PATH
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.interface.types import TokenIds
+
+logger = getLogger('wizz')
+
+_MODEL_FILENAME = 'model_int8.onnx'
+_EXPORT_FILENAME = 'model.onnx'
+_TOKENIZER_FILENAME = 'tokenizer.json'
+_CONFIG_FILENAME = 'pooling.json'
+_EXPORT_ARTIFACTS = (_MODEL_FILENAME, _TOKENIZER_FILENAME, _CONFIG_FILENAME)
+_OPSET_VERSION = 14
+_MIN_NORM = 1e-12
+
+
+class QuantizedOnnxModel:
+    """Sentence transformer exported to ONNX with int8 weights.
+
+    Runs the transformer with ONNX Runtime on CPU, then applies
+    the mean pooling and normalization of the original model.
+    The export and the dynamic quantization happen once, on first
+    use, and need torch; later runs only need onnxruntime.
+    The export is built in a temporary directory and moved into
+    place when complete, so an interrupted one is redone.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        cache_folder: str = EMBEDDING_CACHE_PATH,
+        threads: int | None = None,
+    ) -> None:
+        """Load the quantized model, exporting it first if needed."""
+        import onnxruntime  # noqa: WPS433
+        from tokenizers import Tokenizer  # noqa: WPS433
+
+        export_directory = ensure_exported(
+            model_name,
+            cache_folder=cache_folder,
+        )
+        model_path = os.path.join(export_directory, _MODEL_FILENAME)
+        with open(os.path.join(export_directory, _CONFIG_FILENAME)) as config:
+            pooling = json.load(config)
+        self.normalize = pooling['normalize']
+        self.max_seq_length = pooling['max_seq_length']
+        self.tokenizer = Tokenizer.from_file(
+            os.path.join(export_directory, _TOKENIZER_FILENAME),
+        )
+        self.tokenizer_json = self.tokenizer.to_str()
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        self.tokenizer.enable_padding()
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_path,
+            session_options,
+            providers=['CPUExecutionProvider'],
+        )
+        self.input_names = [
+            model_input.name for model_input in self.session.get_inputs()
+        ]
+
+    def encode(
+        self,
+        sentences: Sequence[str],
+        batch_size: int = 32,
+        **_: object,
+    ) -> np.ndarray:
+        """Encode sentences the way SentenceTransformer.encode does."""
+        if not sentences:
+            return np.empty((0, EMBEDDING_DIM), dtype=DTYPE)
+        return np.concatenate([
+            self._encode_batch(sentences[start:start + batch_size])
+            for start in range(0, len(sentences), batch_size)
+        ])
+
+    def encode_token_ids(
+        self,
+        token_ids: Sequence[TokenIds],
+        batch_size: int = 32,
+    ) -> np.ndarray:
+        """Encode sections given by the ids of the model's own tokens."""
+        if not token_ids:
+            return np.empty((0, EMBEDDING_DIM), dtype=DTYPE)
+        return np.concatenate([
+            self._run(pad_token_ids(token_ids[start:start + batch_size]))
+            for start in range(0, len(token_ids), batch_size)
+        ])
+
+    def _encode_batch(self, sentences: Sequence[str]) -> np.ndarray:
+        """Tokenize a batch of sentences and run the model on it."""
+        encodings = self.tokenizer.encode_batch(list(sentences))
+        return self._run({
+            'input_ids': np.array(
+                [encoding.ids for encoding in encodings],
+                dtype=np.int64,
+            ),
+            'attention_mask': np.array(
+                [encoding.attention_mask for encoding in encodings],
+                dtype=np.int64,
+            ),
+            'token_type_ids': np.array(
+                [encoding.type_ids for encoding in encodings],
+                dtype=np.int64,
+            ),
+        })
+
+    def _run(self, model_inputs: dict[str, np.ndarray]) -> np.ndarray:
+        """Run the model and pool the token states of a batch."""
+        token_states = self.session.run(
+            None,
+            {
+                input_name: model_inputs[input_name]
+                for input_name in self.input_names
+            },
+        )[0]
+        mask = model_inputs['attention_mask'].astype(DTYPE)[..., None]
+        pooled = (token_states * mask).sum(axis=1) / np.maximum(
+            mask.sum(axis=1),
+            _MIN_NORM,
+        )
+        if self.normalize:
+            pooled /= np.maximum(
+                np.linalg.norm(pooled, axis=1, keepdims=True),
+                _MIN_NORM,
+            )
+        return pooled.astype(DTYPE, copy=False)
+
+
+def ensure_exported(
+    model_name: str,
+    *,
+    cache_folder: str = EMBEDDING_CACHE_PATH,
+) -> str:
+    """Export a model unless a complete export exists, and get its path."""
+    export_directory = os.path.join(cache_folder, 'onnx', model_name)
+    if _is_exported(export_directory):
+        return export_directory
+    parent_directory = os.path.dirname(export_directory)
+    os.makedirs(parent_directory, exist_ok=True)
+    staging_directory = tempfile.mkdtemp(
+        prefix='.export-',
+        dir=parent_directory,
+    )
+    try:  # noqa: WPS229, WPS501
+        _export_quantized(model_name, staging_directory, cache_folder)
+        _publish_export(staging_directory, export_directory)
+    finally:
+        shutil.rmtree(staging_directory, ignore_errors=True)
+    return export_directory
+
+
+def _is_exported(export_directory: str) -> bool:
+    """Check that every file of an export is in place."""
+    return all(
+        os.path.exists(os.path.join(export_directory, filename))
+        for filename in _EXPORT_ARTIFACTS
+    )
+
+
+def _publish_export(staging_directory: str, export_directory: str) -> None:
+    """Move a finished export into place, unless another process did."""
+    if _is_exported(export_directory):
+        return
+    # Leftovers of exports written in place by earlier versions.
+    shutil.rmtree(export_directory, ignore_errors=True)
+    try:
+        os.replace(staging_directory, export_directory)
+    except OSError:
+        if not _is_exported(export_directory):
+            raise
+
+
+def _export_quantized(  # noqa: WPS210
+    model_name: str,
+    export_directory: str,
+    cache_folder: str,
+) -> None:
+    """Export the transformer of a model to ONNX and quantize it to int8."""
+    import torch  # noqa: WPS433
+    from onnxruntime.quantization import QuantType  # noqa: WPS433
+    from onnxruntime.quantization import quantize_dynamic  # noqa: WPS433
+    from sentence_transformers import SentenceTransformer  # noqa: WPS433
+    from sentence_transformers.models import Normalize  # noqa: WPS433
+
+    logger.info('Exporting %s to a quantized ONNX model.', model_name)
+    reference = SentenceTransformer(model_name, cache_folder=cache_folder)
+    sample = dict(reference.tokenizer(['wizz'], return_tensors='pt'))
+    export_path = os.path.join(export_directory, _EXPORT_FILENAME)
+    dynamic_axes = {
+        input_name: {0: 'batch', 1: 'sequence'} for input_name in sample
+    }
+    transformer = reference[0].auto_model
+    # A trailing dict of export arguments is passed as keyword arguments.
+    export_args = (sample,)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            export_args,
+            export_path,
+            input_names=list(sample),
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=_OPSET_VERSION,
+        )
+    quantize_dynamic(
+        export_path,
+        os.path.join(export_directory, _MODEL_FILENAME),
+        weight_type=QuantType.QInt8,
+    )
+    os.remove(export_path)
+    reference.tokenizer.save_pretrained(export_directory)
+    with open(os.path.join(export_directory, _CONFIG_FILENAME), 'w') as config:
+        json.dump(
+            {
+                'max_seq_length': reference.max_seq_length,
+                'normalize': any(
+                    isinstance(module, Normalize) for module in reference
+                ),
+            },
+            config,
+        )
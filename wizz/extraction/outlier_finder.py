@@ -1,45 +1,19 @@
 import numpy as np
-from scipy.spatial.distance import cdist
 
 from wizz.extraction import constants
-from wizz.extraction import converters
-from wizz.models import knowledge
 
 _QUARTILES = (25, 75)
+# Rows of blob vectors compared to their sources at a time.
+_BLOCK_ROWS = 65536
 
 
-async def find_outliers_for(  # noqa: WPS210
-    source: knowledge.Source,
-) -> dict[int, tuple[knowledge.Blob, np.ndarray, float]]:
-    """Find outlier sections against the whole document.
+class OutlierFinder:
+    """Detect outlier sections based on distances to their documents.
 
-    Can find no outliers in some cases, which is expected.
+    Works on all documents at once. Sections are rows of a matrix,
+    grouped into consecutive segments with one segment per document,
+    and every step is a vectorized operation over all the segments.
     """
-    ofinder = OutlierFinder()
-    blobmap = {
-        blob.id: blob
-        for blob in await source.awaitable_attrs.blobs
-    }
-    blob_embeddings = {
-        blob_id: converters.hex_to_vector(blob.vector_hex)
-        for blob_id, blob in blobmap.items()
-    }
-    outliers = ofinder(
-        converters.hex_to_vector(source.vector_hex),
-        blob_embeddings,
-    )
-    return {
-        blob_id: (
-            blobmap[blob_id],
-            blob_embeddings[blob_id],
-            distance,
-        )
-        for blob_id, distance in outliers.items()
-    }
-
-
-class OutlierFinder:
-    """Detect outlier sections based on distances to the document."""
 
     def __init__(self, iqr_multiplier: float = constants.PHI) -> None:
         """Initialize the detector with a configurable IQR multiplier."""
@@ -47,33 +21,106 @@ class OutlierFinder:
 
     def __call__(
         self,
-        document_embedding: np.ndarray,
-        section_embeddings: dict[int, np.ndarray],
-    ) -> dict[int, float]:
-        """Detect outliers using the IQR method."""
-        section_ids, embeddings = zip(*section_embeddings.items())
-        distances = self._calculate_distances(document_embedding, embeddings)
-
-        return {
-            section_id: distance
-            for section_id, distance in zip(section_ids, distances)
-            if distance > self._calculate_threshold(distances)
-        }
-
-    def _calculate_distances(
-        self,
-        document_embedding: np.ndarray,
-        section_embeddings: tuple[np.ndarray, ...],
-    ) -> np.ndarray:
-        """Calculate cosine distances."""
-        return cdist(
-            [document_embedding],
+        document_embeddings: np.ndarray,
+        section_embeddings: np.ndarray,
+        *,
+        segment_sizes: np.ndarray,
+        section_rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Detect outliers of every document using the IQR method.
+
+        Returns the cosine distance of every section to its document
+        and a mask of the sections that are outliers. Can find no
+        outliers in some documents, which is expected.
+        Segments must not be empty. If rows of the sections are given,
+        sections are read from those rows of the matrix in blocks,
+        so a memory-mapped matrix is never copied whole.
+        """
+        segment_ids = np.repeat(np.arange(len(segment_sizes)), segment_sizes)
+        if section_rows is None:
+            section_rows = np.arange(len(segment_ids))
+        distances = _calculate_distances(
+            document_embeddings,
             section_embeddings,
-            metric='cosine',
-        )[0]
+            segment_ids,
+            section_rows,
+        )
+        thresholds = self._calculate_thresholds(distances, segment_sizes)
+        return distances, distances > thresholds[segment_ids]
 
-    def _calculate_threshold(self, distances: np.ndarray) -> float:
-        """Calculate the threshold for outlier detection."""
-        first_quartile, third_quartile = np.percentile(distances, _QUARTILES)
+    def _calculate_thresholds(
+        self,
+        distances: np.ndarray,
+        segment_sizes: np.ndarray,
+    ) -> np.ndarray:
+        """Calculate the threshold of every segment for outlier detection."""
+        first_quartile, third_quartile = _segment_percentiles(
+            distances,
+            segment_sizes,
+            _QUARTILES,
+        )
         iqr = third_quartile - first_quartile
         return third_quartile + self.iqr_multiplier * iqr
+
+
+def _calculate_distances(
+    document_embeddings: np.ndarray,
+    section_embeddings: np.ndarray,
+    segment_ids: np.ndarray,
+    section_rows: np.ndarray,
+) -> np.ndarray:
+    """Calculate cosine distances of sections to their documents."""
+    documents = _to_unit_rows(document_embeddings)
+    return np.concatenate([
+        1 - np.einsum(
+            'ij,ij->i',
+            _to_unit_rows(
+                section_embeddings[section_rows[start:start + _BLOCK_ROWS]],
+            ),
+            documents[segment_ids[start:start + _BLOCK_ROWS]],
+        )
+        for start in range(0, len(segment_ids), _BLOCK_ROWS)
+    ])
+
+
+def _to_unit_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normalize rows of vectors in double precision."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    return vectors / np.maximum(
+        np.linalg.norm(vectors, axis=1, keepdims=True),
+        np.finfo(np.float64).tiny,
+    )
+
+
+def _segment_percentiles(
+    distances: np.ndarray,
+    segment_sizes: np.ndarray,
+    percentiles: tuple[float, ...],
+) -> list[np.ndarray]:
+    """Calculate percentiles of the distances in every segment.
+
+    Interpolates linearly between the closest ranks, like np.percentile.
+    """
+    segment_starts = np.cumsum(segment_sizes) - segment_sizes
+    segment_ids = np.repeat(np.arange(len(segment_sizes)), segment_sizes)
+    ordered = distances[np.lexsort((distances, segment_ids))]
+    return [
+        _interpolate_ranks(
+            ordered,
+            segment_starts,
+            (segment_sizes - 1) * percentile / 100,
+        )
+        for percentile in percentiles
+    ]
+
+
+def _interpolate_ranks(
+    ordered: np.ndarray,
+    segment_starts: np.ndarray,
+    ranks: np.ndarray,
+) -> np.ndarray:
+    """Interpolate the sorted distances of every segment at fractional ranks."""
+    lower_ranks = np.floor(ranks)
+    lower = ordered[segment_starts + lower_ranks.astype(np.int64)]
+    upper = ordered[segment_starts + np.ceil(ranks).astype(np.int64)]
+    return lower + (ranks - lower_ranks) * (upper - lower)
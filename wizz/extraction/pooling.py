@@ -0,0 +1,51 @@
+import numpy as np
+
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_DIM
+
+
+def pool_segments(
+    vectors: np.ndarray,
+    *,
+    weights: np.ndarray,
+    segment_sizes: np.ndarray,
+) -> np.ndarray:
+    """Pool consecutive segments of rows into unit vectors.
+
+    Every segment of rows is averaged with the given row weights,
+    then normalized, so the result has one row per segment.
+    Segments must not be empty.
+    """
+    segment_starts = np.cumsum(segment_sizes) - segment_sizes
+    weighted_sums = np.add.reduceat(
+        vectors * weights[:, None],
+        segment_starts,
+        axis=0,
+    )
+    segment_weights = np.add.reduceat(weights, segment_starts)
+    pooled = weighted_sums / segment_weights[:, None]
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    pooled /= np.maximum(norms, np.finfo(DTYPE).tiny)
+    return pooled.astype(DTYPE, copy=False)
+
+
+class RunningPool:
+    """Pool rows that arrive in several groups into one unit vector.
+
+    Keeps only the weighted sum of the rows added so far, which points
+    the same way as their weighted average.
+    """
+
+    def __init__(self) -> None:
+        """Start with no rows."""
+        self._weighted_sum = np.zeros(EMBEDDING_DIM)
+
+    def add(self, vectors: np.ndarray, *, weights: np.ndarray) -> None:
+        """Add rows with their weights to the pool."""
+        self._weighted_sum += weights @ vectors
+
+    def pooled(self) -> np.ndarray:
+        """Get the unit vector of the rows added so far."""
+        norm = np.linalg.norm(self._weighted_sum)
+        pooled = self._weighted_sum / max(norm, np.finfo(DTYPE).tiny)
+        return pooled.astype(DTYPE)
@@ -0,0 +1,111 @@
+import asyncio
+from logging import getLogger
+from typing import Self
+
+import numpy as np
+
+from wizz.constants import SERVE_BATCH_DELAY
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.embedder import Embedder
+
+logger = getLogger('wizz')
+
+_QueuedQuery = tuple[str, 'asyncio.Future[np.ndarray]']
+
+
+class QueryBatcher:  # noqa: WPS214
+    """Embed the queries of concurrent requests in shared model passes.
+
+    A query waits up to max_delay seconds for other queries to join
+    its batch, and a full batch goes to the model at once. Batches
+    are encoded one at a time in a worker thread, so the event loop
+    keeps serving requests while the model runs.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        *,
+        max_size: int = EMBEDDING_BATCH_SIZE,
+        max_delay: float = SERVE_BATCH_DELAY,
+    ) -> None:
+        """Wrap a loaded embedder, which the batcher uses exclusively."""
+        self.embedder = embedder
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue[_QueuedQuery] = asyncio.Queue()
+        self._worker: asyncio.Task[None] | None = None
+
+    async def __aenter__(self) -> Self:
+        """Use the batcher as an async context manager."""
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        """Stop the encoding worker."""
+        await self.close()
+
+    async def embed(self, query: str) -> np.ndarray:
+        """Embed a query together with the ones that arrive close to it."""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop encoding, failing the queries that are still waiting."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    async def _run(self) -> None:
+        """Encode batches of queued queries until cancelled."""
+        while True:  # noqa: WPS457
+            await self._encode(await self._collect())
+
+    async def _encode(self, batch: list[_QueuedQuery]) -> None:
+        """Encode a batch in one pass and hand every query its vector."""
+        logger.debug('Embedding a batch of %s queries.', len(batch))
+        futures = [future for _, future in batch]
+        try:
+            vectors = await asyncio.to_thread(
+                self.embedder.encode,
+                [query for query, _ in batch],
+            )
+        except Exception as error:
+            _fail_pending(futures, error)
+            return
+        for future, vector in zip(futures, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    async def _collect(self) -> list[_QueuedQuery]:
+        """Wait for a query, then for more until the batch closes."""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout),
+                )
+            except TimeoutError:
+                break
+        return batch
+
+
+def _fail_pending(
+    futures: list['asyncio.Future[np.ndarray]'],
+    error: Exception,
+) -> None:
+    """Pass an error of a batch on to the queries still waiting for it."""
+    for future in futures:
+        if not future.done():
+            future.set_exception(error)
@@ -0,0 +1,72 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+from wizz.extraction.batcher import pad_token_ids
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_CACHE_PATH
+from wizz.interface.types import TokenIds
+
+
+class TorchModel:
+    """Sentence transformer that can also encode token ids directly."""
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        cache_folder: str = EMBEDDING_CACHE_PATH,
+        threads: int | None = None,
+    ) -> None:
+        """Load the model, with an optional number of torch threads."""
+        # Importing the model framework alone takes seconds.
+        from sentence_transformers import SentenceTransformer  # noqa: WPS433
+
+        if threads:
+            import torch  # noqa: WPS433
+
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, cache_folder=cache_folder)
+
+    @property
+    def max_seq_length(self) -> int:
+        """Get the number of tokens the model reads from a section."""
+        return self.model.max_seq_length
+
+    @property
+    def tokenizer_json(self) -> str:
+        """Serialize the fast tokenizer of the model."""
+        return self.model.tokenizer.backend_tokenizer.to_str()
+
+    def encode(
+        self,
+        sentences: Sequence[str],
+        batch_size: int = 32,
+    ) -> np.ndarray:
+        """Encode sentences into a matrix."""
+        return self.model.encode(
+            sentences,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+        )
+
+    def encode_token_ids(  # noqa: WPS210
+        self,
+        token_ids: Sequence[TokenIds],
+        batch_size: int = 32,
+    ) -> np.ndarray:
+        """Encode sections given by the ids of the model's own tokens."""
+        import torch  # noqa: WPS433
+
+        batches = []
+        for start in range(0, len(token_ids), batch_size):
+            model_inputs = pad_token_ids(token_ids[start:start + batch_size])
+            features = {
+                input_name: torch.from_numpy(input_array).to(self.model.device)
+                for input_name, input_array in model_inputs.items()
+            }
+            with torch.no_grad():
+                batches.append(
+                    self.model(features)['sentence_embedding'].cpu().numpy(),
+                )
+        return np.concatenate(batches).astype(DTYPE, copy=False)
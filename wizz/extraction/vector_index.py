@@ -0,0 +1,244 @@
+import json
+import os
+from collections.abc import Callable
+from collections.abc import Mapping
+from importlib.util import find_spec
+from types import MappingProxyType
+from typing import NamedTuple
+from typing import Protocol
+
+import numpy as np
+
+from wizz.extraction import constants
+from wizz.extraction.annoy_index import AnnoyIndex
+from wizz.extraction.exact_index import ExactIndex
+from wizz.extraction.hnsw_index import HnswIndex
+from wizz.extraction.vector_store import Neighbours
+from wizz.interface.enums import IndexKind
+
+
+class IndexBuildProfile(NamedTuple):
+    """The kind and the build parameters of a vector index.
+
+    More Annoy trees give better recall for longer builds and bigger
+    files. Jobs only change the build time. An on-disk Annoy build
+    writes the index straight to its file, so it does not have to fit
+    in memory. Parameters that a kind does not use are kept anyway,
+    so they apply again if the kind changes back. The requested kind
+    can be automatic, and the kind is the one that was picked for it.
+    """
+
+    kind: IndexKind
+    requested_kind: IndexKind = IndexKind.automatic
+    trees: int = constants.ANNOY_TREES
+    jobs: int = constants.INDEX_BUILD_JOBS
+    on_disk_build: bool = False
+
+    def builds_like(self, other: 'IndexBuildProfile | None') -> bool:
+        """Check whether another profile builds the same index as this one.
+
+        Neither the jobs nor the requested kind change the built index.
+        """
+        return other is not None and (
+            self.kind,
+            self.trees,
+            self.on_disk_build,
+        ) == (
+            other.kind,
+            other.trees,
+            other.on_disk_build,
+        )
+
+
+class VectorIndex(Protocol):
+    """Nearest neighbour search over vectors of database ids."""
+
+    name: str
+
+    def exists(self) -> bool:
+        """Check whether the index can be queried."""
+
+    def build(
+        self,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        *,
+        profile: IndexBuildProfile,
+        on_added: Callable[[int], None],
+    ) -> None:
+        """Replace the index with a new one of the given vectors."""
+
+    def get_ranked_neighbours_for(
+        self,
+        *,
+        vector: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = constants.INDEX_SEARCH_K,
+    ) -> Neighbours:
+        """Get the n closest ids to a vector by angular distance."""
+
+    def get_ranked_neighbours_for_many(
+        self,
+        *,
+        vectors: np.ndarray,
+        n: int,  # noqa: WPS111
+        search_k: int = constants.INDEX_SEARCH_K,
+    ) -> list[Neighbours]:
+        """Get the n closest ids to every vector of a matrix."""
+
+    def remove(self) -> None:
+        """Delete the files of the index."""
+
+
+_INDEX_TYPES: Mapping[IndexKind, Callable[[str], VectorIndex]] = (
+    MappingProxyType({
+        IndexKind.exact: ExactIndex,
+        IndexKind.annoy: AnnoyIndex,
+        IndexKind.hnsw: HnswIndex,
+    })
+)
+
+
+def choose_index_kind(size: int) -> IndexKind:
+    """Pick the kind of index that suits a number of vectors.
+
+    Exact search is both faster to build and exact for small indices.
+    HNSW has a better recall for its latency than Annoy on big ones,
+    but needs hnswlib, which is optional.
+    """
+    if size <= constants.EXACT_INDEX_MAX_SIZE:
+        return IndexKind.exact
+    if size >= constants.HNSW_MIN_SIZE and find_spec('hnswlib') is not None:
+        return IndexKind.hnsw
+    return IndexKind.annoy
+
+
+def resolve_build_profile(  # noqa: WPS211
+    stored_profile: IndexBuildProfile | None,
+    *,
+    size: int,
+    kind: IndexKind | None,
+    trees: int | None,
+    jobs: int | None,
+    on_disk_build: bool | None,
+) -> IndexBuildProfile:
+    """Override the profile of the last build with the given parameters.
+
+    An automatic kind is picked from the size of the index.
+    """
+    profile = stored_profile or IndexBuildProfile(kind=IndexKind.automatic)
+    requested_kind = profile.requested_kind if kind is None else kind
+    return IndexBuildProfile(
+        kind=(
+            choose_index_kind(size)
+            if requested_kind == IndexKind.automatic
+            else requested_kind
+        ),
+        requested_kind=requested_kind,
+        trees=profile.trees if trees is None else trees,
+        jobs=profile.jobs if jobs is None else jobs,
+        on_disk_build=(
+            profile.on_disk_build if on_disk_build is None else on_disk_build
+        ),
+    )
+
+
+def read_build_profile(unique_name: str) -> IndexBuildProfile | None:
+    """Read the profile of the last build, if the index exists."""
+    metadata_path = _to_metadata_path(unique_name)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as metadata_file:
+        metadata = json.load(metadata_file)
+    profile = IndexBuildProfile(
+        kind=IndexKind(metadata['kind']),
+        requested_kind=IndexKind(metadata['requested_kind']),
+        trees=metadata['trees'],
+        jobs=metadata['jobs'],
+        on_disk_build=metadata['on_disk_build'],
+    )
+    if not _INDEX_TYPES[profile.kind](unique_name).exists():
+        return None
+    return profile
+
+
+def read_build_version(unique_name: str) -> int:
+    """Get a number that changes whenever the index is rebuilt.
+
+    It is zero for an index that was never built, so a reader can
+    tell when to open an index again.
+    """
+    metadata_path = _to_metadata_path(unique_name)
+    if not os.path.exists(metadata_path):
+        return 0
+    return os.stat(metadata_path).st_mtime_ns
+
+
+def open_vector_index(unique_name: str) -> VectorIndex:
+    """Open an index with the kind it was last built with."""
+    profile = read_build_profile(unique_name)
+    if profile is None:
+        raise ValueError(f'Index {unique_name} does not exist.')
+    return _INDEX_TYPES[profile.kind](unique_name)
+
+
+def build_vector_index(
+    unique_name: str,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    *,
+    profile: IndexBuildProfile,
+    on_added: Callable[[int], None],
+) -> VectorIndex:
+    """Replace an index of any kind with a new one of the given kind.
+
+    The previous index stays readable until the new one is built and
+    its profile is in place, and only then are the files of the other
+    kinds deleted.
+    """
+    os.makedirs(constants.VECTOR_INDEX_PATH, exist_ok=True)
+    vector_index = _INDEX_TYPES[profile.kind](unique_name)
+    vector_index.build(ids, vectors, profile=profile, on_added=on_added)
+    _write_build_profile(unique_name, profile, size=len(ids))
+    for kind, index_type in _INDEX_TYPES.items():
+        if kind != profile.kind:
+            index_type(unique_name).remove()
+    return vector_index
+
+
+def remove_vector_index(unique_name: str) -> None:
+    """Delete the files of an index of any kind with its profile."""
+    for index_type in _INDEX_TYPES.values():
+        index_type(unique_name).remove()
+    metadata_path = _to_metadata_path(unique_name)
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+
+def _write_build_profile(
+    unique_name: str,
+    profile: IndexBuildProfile,
+    *,
+    size: int,
+) -> None:
+    """Replace the build profile of an index at once."""
+    metadata_path = _to_metadata_path(unique_name)
+    building_path = f'{metadata_path}.building'
+    with open(building_path, 'w') as metadata_file:
+        json.dump(
+            {
+                'kind': profile.kind,
+                'requested_kind': profile.requested_kind,
+                'trees': profile.trees,
+                'jobs': profile.jobs,
+                'on_disk_build': profile.on_disk_build,
+                'items': size,
+            },
+            metadata_file,
+        )
+    os.replace(building_path, metadata_path)
+
+
+def _to_metadata_path(unique_name: str) -> str:
+    """Get the path to the build profile of an index."""
+    return os.path.join(constants.VECTOR_INDEX_PATH, f'{unique_name}.json')
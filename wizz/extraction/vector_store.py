@@ -0,0 +1,193 @@
+import os
+from collections.abc import Sequence
+from logging import getLogger
+
+import numpy as np
+
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.constants import VECTOR_STORE_PATH
+
+logger = getLogger('wizz')
+
+_ID_DTYPE = np.int64
+
+Neighbours = list[tuple[int, float]]
+
+
+class VectorStore:  # noqa: WPS214
+    """An append-only matrix of vectors kept in flat files.
+
+    Rows of float32 vectors and the database ids they belong to
+    are stored side by side as raw arrays, so readers map them
+    into memory instead of loading them, and processes reading
+    the same store share its pages through the page cache.
+    """
+
+    def __init__(self, unique_name: str) -> None:
+        """Point to a named store, which does not have to exist yet."""
+        self.name = unique_name
+        self.vectors_path = os.path.join(
+            VECTOR_STORE_PATH,
+            f'{unique_name}.f32',
+        )
+        self.ids_path = os.path.join(VECTOR_STORE_PATH, f'{unique_name}.ids')
+        self._inverse_norms = np.empty(0, dtype=DTYPE)
+
+    def __len__(self) -> int:
+        """Count the complete rows in the store."""
+        return min(
+            _file_size(self.ids_path) // _ID_DTYPE().itemsize,
+            _file_size(self.vectors_path) // _row_size(),
+        )
+
+    def append(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """Add rows of vectors with their ids to the end of the store."""
+        os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
+        with open(self.vectors_path, 'ab') as vectors_file:
+            vectors_file.write(np.ascontiguousarray(vectors, DTYPE).tobytes())
+        # Ids go last, so a partial write never maps a row to a wrong id.
+        with open(self.ids_path, 'ab') as ids_file:
+            ids_file.write(np.asarray(ids, dtype=_ID_DTYPE).tobytes())
+
+    def load(self) -> tuple[np.ndarray, np.ndarray]:
+        """Map the ids and the vector matrix of the store into memory."""
+        rows = len(self)
+        if not rows:
+            return (
+                np.empty(0, dtype=_ID_DTYPE),
+                np.empty((0, EMBEDDING_DIM), dtype=DTYPE),
+            )
+        ids = np.memmap(self.ids_path, dtype=_ID_DTYPE, mode='r', shape=rows)
+        vectors = np.memmap(
+            self.vectors_path,
+            dtype=DTYPE,
+            mode='r',
+            shape=(rows, EMBEDDING_DIM),
+        )
+        return ids, vectors
+
+    def summarize_ids(self) -> tuple[int, int]:
+        """Count the rows and find the largest id, which is zero if none."""
+        ids, _ = self.load()
+        return len(ids), int(ids.max(initial=0))
+
+    def rows_for(self, ids: Sequence[int]) -> np.ndarray:
+        """Find the row of every id in the store.
+
+        Raises a ValueError if an id is missing, which means the store
+        is out of sync with the database.
+        """
+        stored_ids, _ = self.load()
+        requested_ids = np.asarray(ids, dtype=_ID_DTYPE)
+        if not len(stored_ids):
+            if requested_ids.size:
+                raise ValueError(f'Vector store {self.name} is empty.')
+            return np.empty(0, dtype=np.intp)
+        by_id = np.argsort(stored_ids, kind='stable')
+        positions = np.searchsorted(stored_ids, requested_ids, sorter=by_id)
+        rows = by_id[np.minimum(positions, len(by_id) - 1)]
+        if not np.array_equal(stored_ids[rows], requested_ids):
+            raise ValueError(
+                f'Vector store {self.name} is out of sync with the database.',
+            )
+        return rows
+
+    def get_ranked_neighbours_for(
+        self,
+        *,
+        vector: np.ndarray,
+        n: int,  # noqa: WPS111
+    ) -> Neighbours:
+        """Get the n closest rows to a vector by exact angular distance."""
+        return self.get_ranked_neighbours_for_many(
+            vectors=np.asarray(vector)[np.newaxis],
+            n=n,
+        )[0]
+
+    def get_ranked_neighbours_for_many(  # noqa: WPS210
+        self,
+        *,
+        vectors: np.ndarray,
+        n: int,  # noqa: WPS111
+    ) -> list[Neighbours]:
+        """Get the n closest rows to every vector of a matrix.
+
+        All vectors are compared to the rows in one matrix product,
+        and only the n best rows of each are sorted.
+        """
+        ids, rows = self.load()
+        queries = np.asarray(vectors, dtype=DTYPE)
+        if not len(ids):
+            return [[] for _ in queries]
+        cosines = (queries @ rows.T) * self._load_inverse_norms(len(ids))
+        cosines /= np.maximum(
+            np.linalg.norm(queries, axis=1, keepdims=True),
+            np.finfo(DTYPE).tiny,
+        )
+        nearest, nearest_cosines = _select_largest(cosines, min(n, len(ids)))
+        return [
+            list(
+                zip(
+                    ids[row_nearest].tolist(),
+                    to_angular_distance(row_cosines).tolist(),
+                ),
+            )
+            for row_nearest, row_cosines in zip(nearest, nearest_cosines)
+        ]
+
+    def remove(self) -> None:
+        """Delete the files of the store."""
+        for path in (self.ids_path, self.vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._inverse_norms = np.empty(0, dtype=DTYPE)
+
+    def _load_inverse_norms(self, rows: int) -> np.ndarray:
+        """Get the inverse norms of the first rows of the store.
+
+        Rows never change once appended, so only the norms of rows
+        appended since the last call are computed.
+        """
+        known_rows = len(self._inverse_norms)
+        if known_rows < rows:
+            _, vectors = self.load()
+            new_norms = np.linalg.norm(vectors[known_rows:rows], axis=1)
+            self._inverse_norms = np.concatenate((
+                self._inverse_norms,
+                1 / np.maximum(new_norms, np.finfo(DTYPE).tiny),
+            ))
+        return self._inverse_norms[:rows]
+
+
+def to_angular_distance(cosines: np.ndarray) -> np.ndarray:
+    """Convert cosine similarities to the angular distance of Annoy."""
+    return np.sqrt(np.maximum(2 - 2 * cosines, 0))
+
+
+def _select_largest(
+    matrix: np.ndarray,
+    n: int,  # noqa: WPS111
+) -> tuple[np.ndarray, np.ndarray]:
+    """Find the columns of the n largest values of every row, largest first.
+
+    Partitions the rows first, so only n values of a row are sorted.
+    """
+    partitioned = np.argpartition(-matrix, n - 1, axis=1)
+    columns = partitioned[:, :n]
+    largest = np.take_along_axis(matrix, columns, axis=1)
+    order = np.argsort(-largest, axis=1, kind='stable')
+    return (
+        np.take_along_axis(columns, order, axis=1),
+        np.take_along_axis(largest, order, axis=1),
+    )
+
+
+def _file_size(path: str) -> int:
+    """Get the size of a file, which is zero if it does not exist."""
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _row_size() -> int:
+    """Get the number of bytes in a stored vector."""
+    return EMBEDDING_DIM * DTYPE().itemsize
@@ -1,8 +1,11 @@
 import hashlib
 import os
-from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from functools import partial
+from pathlib import PurePosixPath
 
-FileStream = Iterable[tuple[str, str, str]]
+DEFAULT_INCLUDE_PATTERNS = ('*.txt',)
 
 
 def shorten_filename(filename: str) -> str:
@@ -14,34 +17,71 @@ def shorten_filename(filename: str) -> str:
     return f'{cropped}...'
 
 
-def get_file_streamer(directory: str) -> tuple[int, FileStream]:
-    """Return the number if files and the streamer of files."""
-    check_actions = [
-        lambda fnm: os.path.isfile(os.path.join(directory, fnm)),
-        lambda fnm: not fnm.startswith('.'),
-        lambda fnm: fnm.endswith('.txt'),
-    ]
-    eligible_files = [
-        filename
-        for filename in os.listdir(directory)
-        if all(check(filename) for check in check_actions)
-    ]
-    file_count = len(eligible_files)
-    stream = stream_files_from(*eligible_files, directory=directory)
-    return file_count, stream
-
-
-def stream_files_from(*filenames: str, directory: str) -> FileStream:
-    """Yield the name, content and the hash of each file in a directory."""
-    for filename in filenames:
-        with open(os.path.join(directory, filename)) as textfile:
-            filecontent = textfile.read()
-            yield filename, filecontent, hash_content(filecontent)
-
-
-def hash_content(string_content: str) -> str:
-    """Hash the content of a file."""
-    return hashlib.sha1(
-        string_content.encode('utf-8'),
-        usedforsecurity=False,
-    ).hexdigest()
+def discover_files(  # noqa: WPS231
+    directory: str,
+    *,
+    include: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+    exclude: Sequence[str] = (),
+) -> Iterator[str]:
+    """Lazily yield paths of loadable files under a directory.
+
+    Walks the tree depth-first with os.scandir, so only the entries
+    of the directories on the current path are held in memory.
+    Hidden files and directories are skipped. Paths are relative to
+    the directory and are matched against glob patterns from the
+    right, so '*.txt' matches text files at any depth.
+    """
+    pending_directories = ['']
+    while pending_directories:
+        relative_directory = pending_directories.pop()
+        visible_entries = _scan_visible(directory, relative_directory, exclude)
+        for entry, relative_path in visible_entries:
+            if entry.is_dir(follow_symlinks=False):
+                pending_directories.append(relative_path)
+            elif entry.is_file() and _matches_any(relative_path, include):
+                yield relative_path
+
+
+def hash_file(path: str) -> str:
+    """Hash the content of a file.
+
+    The file is read in fixed-size binary chunks, so memory use
+    does not depend on its size.
+    """
+    with open(path, 'rb') as binaryfile:
+        return hashlib.file_digest(
+            binaryfile,
+            lambda: hashlib.sha1(usedforsecurity=False),
+        ).hexdigest()
+
+
+def read_text(path: str) -> str:
+    """Read the content of a text file."""
+    with open(path, encoding='utf-8', errors='replace') as textfile:
+        return textfile.read()
+
+
+def stream_text(path: str, piece_size: int) -> Iterator[str]:
+    """Lazily read a text file in pieces of up to a number of characters."""
+    with open(path, encoding='utf-8', errors='replace') as textfile:
+        yield from iter(partial(textfile.read, piece_size), '')
+
+
+def _scan_visible(
+    directory: str,
+    relative_directory: str,
+    exclude: Sequence[str],
+) -> Iterator[tuple[os.DirEntry, str]]:
+    """Yield entries of a directory that are neither hidden nor excluded."""
+    with os.scandir(os.path.join(directory, relative_directory)) as found:
+        for entry in found:
+            relative_path = os.path.join(relative_directory, entry.name)
+            is_hidden = entry.name.startswith('.')
+            if not is_hidden and not _matches_any(relative_path, exclude):
+                yield entry, relative_path
+
+
+def _matches_any(relative_path: str, patterns: Sequence[str]) -> bool:
+    """Check if a relative path matches any of the glob patterns."""
+    posix_path = PurePosixPath(*relative_path.split(os.sep))
+    return any(posix_path.match(pattern) for pattern in patterns)
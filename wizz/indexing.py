@@ -0,0 +1,189 @@
+from collections.abc import AsyncIterator
+from collections.abc import Callable
+from collections.abc import Sequence
+from logging import getLogger
+from typing import Any
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wizz import constants
+from wizz import crud
+from wizz.extraction import converters
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.outlier_finder import OutlierFinder
+from wizz.extraction.vector_index import VectorIndex
+from wizz.extraction.vector_store import Neighbours
+from wizz.extraction.vector_store import VectorStore
+from wizz.models import knowledge
+
+logger = getLogger('wizz')
+
+
+class Outliers(NamedTuple):
+    """Outlier blobs with their sources, vectors and source distances."""
+
+    blob_ids: np.ndarray
+    source_ids: np.ndarray
+    vectors: np.ndarray
+    distances: np.ndarray
+
+
+async def sync_vector_stores(
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+    source_store: VectorStore,
+    blob_store: VectorStore,
+) -> None:
+    """Rebuild the vector stores of a context that went out of sync.
+
+    A store misses rows if loading was interrupted between the commit
+    and the append, or if the context was loaded before stores existed.
+    Comparing the largest IDs too catches a store that has as many rows
+    as the database, but of other rows.
+    """
+    source_ids = await crud.summarize_source_ids(session, context=context)
+    if source_store.summarize_ids() != source_ids:
+        logger.info('Rebuilding vector store %s.', source_store.name)
+        await _rebuild(
+            source_store,
+            crud.stream_source_vectors(session, context=context),
+        )
+    blob_ids = await crud.summarize_blob_ids(session, context=context)
+    if blob_store.summarize_ids() != blob_ids:
+        logger.info('Rebuilding vector store %s.', blob_store.name)
+        await _rebuild(
+            blob_store,
+            crud.stream_blob_vectors(session, context=context),
+        )
+
+
+async def find_context_outliers(  # noqa: WPS210
+    session: AsyncSession,
+    *,
+    context: knowledge.Context,
+    source_store: VectorStore,
+    blob_store: VectorStore,
+    only_unindexed: bool = False,
+) -> Outliers:
+    """Find outlier blobs of all sources in a context in one pass.
+
+    Vectors come from the stores, so only ids are read from the database.
+    Looks only at unindexed sources if asked to.
+    """
+    blob_sources = [
+        np.array(partition, dtype=np.int64)
+        async for partition in crud.stream_blob_sources(
+            session,
+            context=context,
+            only_unindexed=only_unindexed,
+        )
+    ]
+    if not blob_sources:
+        return Outliers(
+            blob_ids=np.empty(0, dtype=np.int64),
+            source_ids=np.empty(0, dtype=np.int64),
+            vectors=np.empty((0, EMBEDDING_DIM), dtype=DTYPE),
+            distances=np.empty(0),
+        )
+    blob_ids, source_ids = np.concatenate(blob_sources).T
+    # Blobs are ordered by source, so every source is one segment.
+    segment_source_ids, segment_sizes = np.unique(
+        source_ids,
+        return_counts=True,
+    )
+    _, source_vectors = source_store.load()
+    _, blob_vectors = blob_store.load()
+    blob_rows = blob_store.rows_for(blob_ids)
+    distances, is_outlier = OutlierFinder()(
+        source_vectors[source_store.rows_for(segment_source_ids)],
+        blob_vectors,
+        segment_sizes=segment_sizes,
+        section_rows=blob_rows,
+    )
+    return Outliers(
+        blob_ids=blob_ids[is_outlier],
+        source_ids=source_ids[is_outlier],
+        vectors=blob_vectors[blob_rows[is_outlier]],
+        distances=distances[is_outlier],
+    )
+
+
+async def link_outliers(  # noqa: WPS210
+    session: AsyncSession,
+    *,
+    outliers: Outliers,
+    source_index: VectorIndex,
+    on_linked: Callable[[int], None],
+) -> int:
+    """Link every outlier blob to its closest source other than its own.
+
+    Looks up a few neighbours per outlier to skip the outlier's source,
+    and leaves out outliers without another source nearby. Looks up
+    the vectors of a batch of outliers at once and writes their links
+    with one bulk insert, without committing. Returns the number of
+    created links.
+    """
+    total_links = 0
+    for start in range(0, len(outliers.blob_ids), constants.LINK_BATCH_SIZE):
+        batch = slice(start, start + constants.LINK_BATCH_SIZE)
+        all_ranked_destinations = source_index.get_ranked_neighbours_for_many(
+            vectors=outliers.vectors[batch],
+            n=constants.LINK_NEIGHBOURS,
+        )
+        candidate_rows = map(
+            _to_link_row,
+            outliers.blob_ids[batch].tolist(),
+            outliers.source_ids[batch].tolist(),
+            outliers.distances[batch].tolist(),
+            all_ranked_destinations,
+        )
+        link_rows = [row for row in candidate_rows if row is not None]
+        await crud.bulk_create_links(session, rows=link_rows, commit=False)
+        total_links += len(link_rows)
+        on_linked(len(all_ranked_destinations))
+    return total_links
+
+
+async def append_streamed_vectors(
+    store: VectorStore,
+    partitions: AsyncIterator[Sequence[Row]],
+) -> None:
+    """Append streamed (id, vector) rows to a store."""
+    async for partition in partitions:
+        ids, vectors = zip(*partition)
+        store.append(
+            ids,
+            np.stack([converters.bytes_to_vector(row) for row in vectors]),
+        )
+
+
+def _to_link_row(
+    blob_id: int,
+    source_id: int,
+    origin_distance: float,
+    ranked_destinations: Neighbours,
+) -> dict[str, Any] | None:
+    """Link an outlier to its closest source other than its own, if any."""
+    for destination_id, destination_distance in ranked_destinations:
+        if destination_id != source_id:
+            return {
+                'blob_id': blob_id,
+                'target_source_id': destination_id,
+                'origin_distance': origin_distance,
+                'destination_distance': destination_distance,
+            }
+    return None
+
+
+async def _rebuild(
+    store: VectorStore,
+    partitions: AsyncIterator[Sequence[Row]],
+) -> None:
+    """Replace the content of a store with streamed (id, vector) rows."""
+    store.remove()
+    await append_streamed_vectors(store, partitions)
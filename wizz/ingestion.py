@@ -0,0 +1,705 @@
+import asyncio
+import os
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Any
+from typing import NamedTuple
+from typing import Optional
+from typing import TYPE_CHECKING
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wizz import constants
+from wizz import crud
+from wizz.database import get_db_session
+from wizz.extraction import converters
+from wizz.extraction.batcher import load_model_tokenizer
+from wizz.extraction.batcher import ModelBatcher
+from wizz.extraction.batcher import StreamingModelBatcher
+from wizz.extraction.batcher import StreamingTextBatcher
+from wizz.extraction.batcher import TextBatcher
+from wizz.extraction.constants import DTYPE
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.constants import EMBEDDING_DIM
+from wizz.extraction.embedder import Embedder
+from wizz.extraction.embedding_pool import EmbeddingPool
+from wizz.extraction.pooling import pool_segments
+from wizz.extraction.pooling import RunningPool
+from wizz.extraction.vector_store import VectorStore
+from wizz.filesystem import hash_file
+from wizz.filesystem import read_text
+from wizz.filesystem import stream_text
+from wizz.indexing import append_streamed_vectors
+from wizz.interface.enums import ChunkingMode
+from wizz.interface.enums import VectorPrecision
+from wizz.interface.types import TextChunk
+from wizz.interface.types import TokenIds
+from wizz.models import knowledge
+
+if TYPE_CHECKING:
+    import tokenizers
+
+
+class PendingFile(NamedTuple):
+    """A new file read and chunked for embedding.
+
+    A large file comes in several parts of a bounded number of chunks,
+    in order and without its content, and a part is embedded and
+    written on its own.
+    """
+
+    path: str
+    filecontent: str
+    hashstr: str
+    chunks: list[TextChunk]
+    # With model chunking, the token ids of every section to embed.
+    token_ids: list[TokenIds] | None
+    is_first_part: bool = True
+    is_last_part: bool = True
+
+
+EmbeddedBatch = tuple[list[PendingFile], np.ndarray, np.ndarray]
+ChunkGroup = tuple[list[TextChunk], Optional[list[TokenIds]]]
+
+# Marks the end of a stream passed between stages.
+_END_OF_STREAM = None
+
+
+class IngestionPipeline:  # noqa: WPS214, WPS230
+    """Load files into a context through concurrent bounded stages.
+
+    The stages are discovery, hashing, deduplication, reading and
+    chunking, embedding and writing. Each stage runs as its own task
+    and hands its results over through a bounded queue, so the embedder
+    keeps working while files are read and earlier batches are written.
+    Only files that pass deduplication are read into memory, and at most
+    a few queues worth of them are held at once. Files larger than
+    STREAMING_FILE_SIZE are read, embedded and written a part at a time,
+    so memory does not grow with the size of a file.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        embedder: Embedder | EmbeddingPool,
+        *,
+        context_name: str,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        queue_size: int = constants.INGESTION_QUEUE_SIZE,
+        vector_precision: VectorPrecision = VectorPrecision.float32,
+        chunking: ChunkingMode = ChunkingMode.tiktoken,
+        on_file_found: Callable[[], None] | None = None,
+        on_file_done: Callable[[], None] | None = None,
+    ) -> None:
+        """Set up a pipeline for loading files into a named context."""
+        self.embedder = embedder
+        self.context_name = context_name
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.vector_dtype = np.dtype(vector_precision.value)
+        self.chunking = chunking
+        self.on_file_found = on_file_found or (lambda: None)
+        self.on_file_done = on_file_done or (lambda: None)
+        self.found_files = 0
+        self.loaded_files = 0
+        self.skipped_files = 0
+        # The pooled vector and the source of the large file in progress.
+        self._part_pool = RunningPool()
+        self._part_source_id = 0
+
+    async def run(  # noqa: WPS210
+        self,
+        paths: Iterable[str],
+        *,
+        directory: str,
+    ) -> None:
+        """Load files by paths relative to a directory.
+
+        Returns when all new files are written.
+        """
+        discovered: asyncio.Queue = asyncio.Queue(self.queue_size)
+        hashed: asyncio.Queue = asyncio.Queue(self.queue_size)
+        new: asyncio.Queue = asyncio.Queue(self.queue_size)
+        chunked: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embedded: asyncio.Queue = asyncio.Queue(2)
+        async with get_db_session() as session:
+            context_instance = await crud.get_or_create_context(
+                session,
+                name=self.context_name,
+            )
+        # The model runs on one thread, so batches are never interleaved.
+        with ThreadPoolExecutor(max_workers=1) as embedding_executor:
+            async with asyncio.TaskGroup() as stages:
+                stages.create_task(self._discover(paths, discovered))
+                stages.create_task(self._hash(discovered, hashed, directory))
+                stages.create_task(
+                    self._deduplicate(hashed, new, context_instance.id),
+                )
+                stages.create_task(self._chunk(new, chunked, directory))
+                stages.create_task(
+                    self._embed(chunked, embedded, embedding_executor),
+                )
+                stages.create_task(
+                    self._write(embedded, context_instance.id),
+                )
+
+    async def _discover(
+        self,
+        paths: Iterable[str],
+        outbox: asyncio.Queue,
+    ) -> None:
+        """Feed the paths of the files to load as they are found."""
+        loop = asyncio.get_running_loop()
+        path_stream = iter(paths)
+        while True:
+            found_paths = await loop.run_in_executor(
+                None,
+                partial(_take, path_stream, self.queue_size),
+            )
+            if not found_paths:
+                break
+            for path in found_paths:
+                self.found_files += 1
+                self.on_file_found()
+                await outbox.put(path)
+        await outbox.put(_END_OF_STREAM)
+
+    async def _hash(
+        self,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+        directory: str,
+    ) -> None:
+        """Hash files off the event loop."""
+        loop = asyncio.get_running_loop()
+        while (path := await inbox.get()) is not _END_OF_STREAM:
+            hashstr = await loop.run_in_executor(
+                None,
+                hash_file,
+                os.path.join(directory, path),
+            )
+            await outbox.put((path, hashstr))
+        await outbox.put(_END_OF_STREAM)
+
+    async def _deduplicate(  # noqa: WPS210
+        self,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+        context_id: int,
+    ) -> None:
+        """Drop the files the context has already or that repeat in this run.
+
+        Checks every batch of hashes that is ready with a single query.
+        """
+        seen_hashes: set[str] = set()
+        is_streaming = True
+        async with get_db_session() as session:
+            context_instance = await crud.get_single_object(
+                session,
+                model=knowledge.Context,
+                object_id=context_id,
+            )
+            while is_streaming:
+                hashed_files, is_streaming = await _get_ready(
+                    inbox,
+                    self.queue_size,
+                )
+                known_hashes = await crud.filter_known_hashes(
+                    session,
+                    context=context_instance,
+                    hashstrings={hashstr for _, hashstr in hashed_files},
+                )
+                for hashed in hashed_files:
+                    await self._forward_if_new(
+                        hashed,
+                        outbox,
+                        known_hashes=known_hashes,
+                        seen_hashes=seen_hashes,
+                    )
+        await outbox.put(_END_OF_STREAM)
+
+    async def _forward_if_new(
+        self,
+        hashed: tuple[str, str],
+        outbox: asyncio.Queue,
+        *,
+        known_hashes: set[str],
+        seen_hashes: set[str],
+    ) -> None:
+        """Pass a file on unless its hash is known or was seen already."""
+        _, hashstr = hashed
+        if hashstr in known_hashes or hashstr in seen_hashes:
+            self.skipped_files += 1
+            self.on_file_done()
+            return
+        seen_hashes.add(hashstr)
+        await outbox.put(hashed)
+
+    async def _chunk(  # noqa: WPS210
+        self,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+        directory: str,
+    ) -> None:
+        """Read new files and split them into token chunks off the loop.
+
+        With model chunking, the tokenizer of the embedding model
+        sizes the chunks and its token ids are kept for embedding.
+        Large files are chunked as they are read and passed on in parts.
+        """
+        loop = asyncio.get_running_loop()
+        tokenizer = None
+        read_and_chunk = _read_and_chunk
+        if self.chunking == ChunkingMode.model:
+            tokenizer = load_model_tokenizer(*self.embedder.tokenizer_spec)
+            read_and_chunk = partial(
+                _read_and_chunk_for_model,
+                tokenizer=tokenizer,
+            )
+        while (hashed := await inbox.get()) is not _END_OF_STREAM:
+            path, hashstr = hashed
+            full_path = os.path.join(directory, path)
+            if os.path.getsize(full_path) > constants.STREAMING_FILE_SIZE:
+                chunk_groups = _stream_chunk_groups(
+                    full_path,
+                    group_size=self.batch_size,
+                    tokenizer=tokenizer,
+                )
+                await self._forward_parts(hashed, chunk_groups, outbox)
+                continue
+            filecontent, chunks, token_ids = await loop.run_in_executor(
+                None,
+                read_and_chunk,
+                full_path,
+            )
+            await outbox.put(
+                PendingFile(path, filecontent, hashstr, chunks, token_ids),
+            )
+        await outbox.put(_END_OF_STREAM)
+
+    async def _forward_parts(  # noqa: WPS210
+        self,
+        hashed: tuple[str, str],
+        chunk_groups: Iterator[ChunkGroup],
+        outbox: asyncio.Queue,
+    ) -> None:
+        """Pass on the groups of chunks of a large file as they are read.
+
+        Reads one group ahead to tell which part is the last.
+        """
+        path, hashstr = hashed
+        loop = asyncio.get_running_loop()
+        chunk_group = await loop.run_in_executor(None, next, chunk_groups)
+        is_first_part = True
+        while chunk_group is not None:
+            next_group = await loop.run_in_executor(
+                None,
+                next,
+                chunk_groups,
+                None,
+            )
+            chunks, token_ids = chunk_group
+            await outbox.put(
+                PendingFile(
+                    path,
+                    '',
+                    hashstr,
+                    chunks,
+                    token_ids,
+                    is_first_part=is_first_part,
+                    is_last_part=next_group is None,
+                ),
+            )
+            is_first_part = False
+            chunk_group = next_group
+
+    async def _embed(  # noqa: WPS210, WPS217
+        self,
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue,
+        executor: ThreadPoolExecutor,
+    ) -> None:
+        """Embed the sections of several files in full batches.
+
+        A part of a large file is a batch of its own, after the files
+        that came before it.
+        """
+        pending_files: list[PendingFile] = []
+        pending_sections = 0
+        while (pending_file := await inbox.get()) is not _END_OF_STREAM:
+            is_part = _is_part(pending_file)
+            if not is_part:
+                pending_files.append(pending_file)
+                pending_sections += len(_file_sections(pending_file))
+            is_full = pending_sections >= self.batch_size
+            if pending_files and (is_part or is_full):
+                embedded = await self._embed_files(pending_files, executor)
+                await outbox.put(embedded)
+                pending_files = []
+                pending_sections = 0
+            if is_part:
+                await outbox.put(await self._embed_part(pending_file, executor))
+        if pending_files:
+            embedded = await self._embed_files(pending_files, executor)
+            await outbox.put(embedded)
+        await outbox.put(_END_OF_STREAM)
+
+    async def _embed_files(
+        self,
+        pending_files: list[PendingFile],
+        executor: ThreadPoolExecutor,
+    ) -> EmbeddedBatch:
+        """Run the embedder over all sections of the files.
+
+        Source vectors are pooled from the vectors of their chunks,
+        weighted by chunk length, so they cover the whole file.
+        """
+        sections_per_file = [
+            _file_sections(pending_file) for pending_file in pending_files
+        ]
+        sections = [
+            section
+            for file_sections in sections_per_file
+            for section in file_sections
+        ]
+        vectors = await self._encode(pending_files, sections, executor)
+        source_vectors = pool_segments(
+            vectors,
+            weights=_section_weights(sections),
+            segment_sizes=np.array(
+                [len(file_sections) for file_sections in sections_per_file],
+            ),
+        )
+        blob_vectors = vectors[_blob_rows_mask(pending_files)]
+        return pending_files, source_vectors, blob_vectors
+
+    async def _embed_part(
+        self,
+        part: PendingFile,
+        executor: ThreadPoolExecutor,
+    ) -> EmbeddedBatch:
+        """Run the embedder over the sections of a part of a large file.
+
+        The source vector is pooled as the parts go by, and comes
+        with the last part.
+        """
+        sections = _file_sections(part)
+        vectors = await self._encode([part], sections, executor)
+        if part.is_first_part:
+            self._part_pool = RunningPool()
+        self._part_pool.add(vectors, weights=_section_weights(sections))
+        source_vectors = np.empty((0, EMBEDDING_DIM), dtype=DTYPE)
+        if part.is_last_part:
+            source_vectors = self._part_pool.pooled()[np.newaxis]
+        return [part], source_vectors, vectors[_blob_rows_mask([part])]
+
+    async def _encode(
+        self,
+        pending_files: list[PendingFile],
+        sections: list[str],
+        executor: ThreadPoolExecutor,
+    ) -> np.ndarray:
+        """Embed the sections of files on the embedding thread."""
+        encode = partial(self.embedder, sections)
+        if self.chunking == ChunkingMode.model:
+            encode = partial(
+                self.embedder.encode_token_ids,
+                [
+                    section_ids
+                    for pending_file in pending_files
+                    for section_ids in pending_file.token_ids  # type: ignore
+                ],
+                sections=sections,
+            )
+        return await asyncio.get_running_loop().run_in_executor(
+            executor,
+            encode,
+        )
+
+    async def _write(  # noqa: WPS210
+        self,
+        inbox: asyncio.Queue,
+        context_id: int,
+    ) -> None:
+        """Store embedded files, committing once per batch.
+
+        Committed vectors are appended to the vector stores of the context.
+        The parts of a large file are committed together.
+        """
+        source_store = VectorStore(
+            converters.to_source_ix_name(self.context_name),
+        )
+        blob_store = VectorStore(converters.to_blob_ix_name(self.context_name))
+        async with get_db_session() as session:
+            while (embedded := await inbox.get()) is not _END_OF_STREAM:
+                pending_files, source_vectors, blob_vectors = embedded
+                if _is_part(pending_files[0]):
+                    await self._write_part(
+                        session,
+                        embedded,
+                        context_id=context_id,
+                        source_store=source_store,
+                        blob_store=blob_store,
+                    )
+                    continue
+                source_ids, blob_ids = await _store_embedded_files(
+                    session,
+                    context_id=context_id,
+                    pending_files=pending_files,
+                    source_vectors=source_vectors,
+                    blob_vectors=blob_vectors,
+                    vector_dtype=self.vector_dtype,
+                )
+                source_store.append(source_ids, source_vectors)
+                blob_store.append(blob_ids, blob_vectors)
+                for _ in pending_files:
+                    self.loaded_files += 1
+                    self.on_file_done()
+
+    async def _write_part(  # noqa: WPS211
+        self,
+        session: AsyncSession,
+        embedded: EmbeddedBatch,
+        *,
+        context_id: int,
+        source_store: VectorStore,
+        blob_store: VectorStore,
+    ) -> None:
+        """Store a part of a large file, committing after the last part.
+
+        Nothing of the file is committed before, so an interrupted load
+        leaves no partial file behind. Its source gets its vector with
+        the last part. The blob vectors are appended to the store from
+        the database after the commit, so they are not held meanwhile.
+        """
+        (part,), source_vectors, blob_vectors = embedded
+        if part.is_first_part:
+            source_ids = await crud.bulk_create_sources(
+                session,
+                rows=[_to_source_row(part, context_id=context_id, vector=b'')],
+                commit=False,
+            )
+            self._part_source_id = source_ids[0]
+        await crud.bulk_create_blobs(
+            session,
+            rows=_to_blob_rows(
+                part,
+                blob_vectors,
+                source_id=self._part_source_id,
+                vector_dtype=self.vector_dtype,
+            ),
+            commit=False,
+            return_ids=False,
+        )
+        if not part.is_last_part:
+            return
+        await crud.set_source_vector(
+            session,
+            source_id=self._part_source_id,
+            vector=converters.vector_to_bytes(
+                source_vectors[0],
+                self.vector_dtype,
+            ),
+        )
+        source_store.append([self._part_source_id], source_vectors)
+        await append_streamed_vectors(
+            blob_store,
+            crud.stream_source_blob_vectors(
+                session,
+                source_id=self._part_source_id,
+            ),
+        )
+        self.loaded_files += 1
+        self.on_file_done()
+
+
+async def _get_ready(
+    inbox: asyncio.Queue,
+    limit: int,
+) -> tuple[list, bool]:
+    """Wait for an item and take the others that are ready, up to a limit.
+
+    Also tells whether the stream continues after the taken items.
+    """
+    taken = [await inbox.get()]
+    while len(taken) < limit and not inbox.empty():
+        taken.append(inbox.get_nowait())
+    if taken[-1] is _END_OF_STREAM:
+        return taken[:-1], False
+    return taken, True
+
+
+def _take(paths: Iterator[str], count: int) -> list[str]:
+    """Take up to a number of paths from a stream."""
+    return list(islice(paths, count))
+
+
+def _read_and_chunk(path: str) -> tuple[str, list[TextChunk], None]:
+    """Read a text file and split it into token chunks."""
+    filecontent = read_text(path)
+    return filecontent, list(TextBatcher(filecontent)), None
+
+
+def _read_and_chunk_for_model(
+    path: str,
+    *,
+    tokenizer: 'tokenizers.Tokenizer',
+) -> tuple[str, list[TextChunk], list[TokenIds]]:
+    """Read a text file and split it into windows of model tokens.
+
+    Returns the token ids of every section to embed along with the chunks.
+    """
+    filecontent = read_text(path)
+    tokenized_chunks = list(ModelBatcher(filecontent, tokenizer))
+    if not tokenized_chunks:
+        return filecontent, [], [tokenizer.encode(filecontent).ids]
+    chunks, token_ids = zip(*tokenized_chunks)
+    return filecontent, list(chunks), list(token_ids)
+
+
+def _stream_chunk_groups(  # noqa: WPS210
+    path: str,
+    *,
+    group_size: int,
+    tokenizer: 'tokenizers.Tokenizer | None',
+) -> Iterator[ChunkGroup]:
+    """Chunk a large text file as it is read, in groups of chunks.
+
+    Chunks come with their token ids with a model tokenizer. A file
+    without chunks still gives an empty group, so it gets a source.
+    """
+    pieces = stream_text(path, constants.TEXT_PIECE_SIZE)
+    tokenized_chunks: Iterator[tuple[TextChunk, TokenIds | None]] = (
+        (chunk, None) for chunk in StreamingTextBatcher(pieces)
+    )
+    empty_group: ChunkGroup = ([], None)
+    if tokenizer is not None:
+        tokenized_chunks = iter(StreamingModelBatcher(pieces, tokenizer))
+        empty_group = ([], [tokenizer.encode('').ids])
+    is_empty = True
+    while chunk_group := list(islice(tokenized_chunks, group_size)):
+        is_empty = False
+        chunks, token_ids = zip(*chunk_group)
+        yield list(chunks), None if tokenizer is None else list(token_ids)
+    if is_empty:
+        yield empty_group
+
+
+async def _store_embedded_files(  # noqa: WPS210, WPS211
+    session: AsyncSession,
+    *,
+    context_id: int,
+    pending_files: list[PendingFile],
+    source_vectors: np.ndarray,
+    blob_vectors: np.ndarray,
+    vector_dtype: np.dtype,
+) -> tuple[list[int], list[int]]:
+    """Store sources and blobs of several embedded files in one commit.
+
+    Returns the ids of the new sources and blobs in the order of vectors.
+    """
+    source_ids = await crud.bulk_create_sources(
+        session,
+        rows=[
+            _to_source_row(
+                pending_file,
+                context_id=context_id,
+                vector=converters.vector_to_bytes(source_vector, vector_dtype),
+            )
+            for pending_file, source_vector in zip(
+                pending_files,
+                source_vectors,
+            )
+        ],
+        commit=False,
+    )
+    blob_rows = []
+    blob_position = 0
+    for pending_file, source_id in zip(pending_files, source_ids):
+        blob_stop = blob_position + len(pending_file.chunks)
+        blob_rows.extend(
+            _to_blob_rows(
+                pending_file,
+                blob_vectors[blob_position:blob_stop],
+                source_id=source_id,
+                vector_dtype=vector_dtype,
+            ),
+        )
+        blob_position = blob_stop
+    blob_ids = await crud.bulk_create_blobs(
+        session,
+        rows=blob_rows,
+        commit=False,
+    )
+    await session.commit()
+    return source_ids, blob_ids
+
+
+def _to_source_row(
+    pending_file: PendingFile,
+    *,
+    context_id: int,
+    vector: bytes,
+) -> dict[str, Any]:
+    """Describe the source of a file as a row to insert."""
+    return {
+        'context_id': context_id,
+        'name': pending_file.path,
+        'hash': pending_file.hashstr,
+        'vector': vector,
+    }
+
+
+def _to_blob_rows(
+    pending_file: PendingFile,
+    blob_vectors: np.ndarray,
+    *,
+    source_id: int,
+    vector_dtype: np.dtype,
+) -> list[dict[str, Any]]:
+    """Describe the chunks of a file with their vectors as rows to insert."""
+    return [
+        {
+            'source_id': source_id,
+            'text': textblob,
+            'blob_index': ix,
+            'vector': converters.vector_to_bytes(vector, vector_dtype),
+        }
+        for (ix, textblob), vector in zip(pending_file.chunks, blob_vectors)
+    ]
+
+
+def _is_part(pending_file: PendingFile) -> bool:
+    """Check if a file is a part of a large file."""
+    return not (pending_file.is_first_part and pending_file.is_last_part)
+
+
+def _section_weights(sections: list[str]) -> np.ndarray:
+    """Weigh the vectors of sections by their length when pooling."""
+    return np.array(
+        [max(len(section), 1) for section in sections],
+        dtype=DTYPE,
+    )
+
+
+def _file_sections(pending_file: PendingFile) -> list[str]:
+    """List the sections to embed for a file.
+
+    A file without chunks, which is an empty one, is embedded whole,
+    so its source still gets a vector.
+    """
+    return [
+        textblob for _, textblob in pending_file.chunks
+    ] or [pending_file.filecontent]
+
+
+def _blob_rows_mask(pending_files: list[PendingFile]) -> np.ndarray:
+    """Mark the rows of blob vectors among the vectors of file sections."""
+    return np.repeat(
+        [bool(pending_file.chunks) for pending_file in pending_files],
+        [len(_file_sections(pending_file)) for pending_file in pending_files],
+    )
@@ -7,3 +7,36 @@ class MessageRole(StrEnum):
     user = auto()
     system = auto()
     assistant = auto()
+
+
+class EmbeddingBackend(StrEnum):
+    """Runtime that computes the embeddings."""
+    torch = auto()
+    onnx_int8 = auto()
+
+
+class ChunkingMode(StrEnum):
+    """Tokenizer that sizes the chunks of a text."""
+    tiktoken = auto()
+    model = auto()
+
+
+class VectorPrecision(StrEnum):
+    """Floating point precision of stored vectors."""
+    float32 = auto()
+    float16 = auto()
+
+
+class IndexKind(StrEnum):
+    """Nearest neighbour search algorithm of a vector index."""
+    automatic = auto()
+    exact = auto()
+    annoy = auto()
+    hnsw = auto()
+
+
+class SearchMode(StrEnum):
+    """Way of ranking blobs for a query."""
+    lexical = auto()
+    vector = auto()
+    hybrid = auto()
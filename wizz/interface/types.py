@@ -1,3 +1,5 @@
 from wizz.interface.enums import MessageRole
 
 MessageTuple = tuple[MessageRole, str]
+TextChunk = tuple[int, str]
+TokenIds = list[int]
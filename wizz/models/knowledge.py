@@ -1,4 +1,11 @@
+from datetime import datetime
+
+from sqlalchemy import column
+from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import LargeBinary
+from sqlalchemy import table
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
@@ -26,6 +33,10 @@ class Context(Base):
 class Source(Base):
     """A metadata about a source text."""
 
+    __table_args__ = (
+        Index('ix_source_context_id_hash', 'context_id', 'hash', unique=True),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True)
     context_id: Mapped[int] = mapped_column(
         ForeignKey('context.id', ondelete='CASCADE'),
@@ -33,7 +44,12 @@ class Source(Base):
     )
     name: Mapped[str] = mapped_column(nullable=False)
     hash: Mapped[str] = mapped_column(nullable=False)
-    vector_hex: Mapped[str] = mapped_column(nullable=False)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # Unset until an index run has linked the blobs of the source.
+    indexed_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )
 
     context: Mapped['Context'] = relationship(
         'Context', back_populates='sources',
@@ -57,10 +73,11 @@ class Blob(Base):
     source_id: Mapped[int] = mapped_column(
         ForeignKey('source.id', ondelete='CASCADE'),
         nullable=False,
+        index=True,
     )
     text: Mapped[str] = mapped_column(nullable=False)
     blob_index: Mapped[int] = mapped_column(nullable=False)
-    vector_hex: Mapped[str] = mapped_column(nullable=False)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
 
     source: Mapped['Source'] = relationship('Source', back_populates='blobs')
     links: Mapped[list['Link']] = relationship(
@@ -89,3 +106,15 @@ class Link(Base):
     target_source: Mapped['Source'] = relationship(
         'Source', back_populates='links',
     )
+
+
+# The FTS5 index of blob texts, with the rowid of the blob. Created
+# by a migration and kept in sync by triggers on the blob table, it is
+# not part of the metadata, which can not create virtual tables.
+# The column named after the table is what a MATCH expression filters.
+blob_fts = table(
+    'blob_fts',
+    column('rowid'),
+    column('blob_fts'),
+    column('rank'),
+)
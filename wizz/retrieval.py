@@ -0,0 +1,152 @@
+import asyncio
+from collections import defaultdict
+from collections.abc import Sequence
+from concurrent.futures import Executor
+from functools import partial
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from wizz import constants
+from wizz import crud
+from wizz.extraction import converters
+from wizz.extraction.constants import EMBEDDING_BATCH_SIZE
+from wizz.extraction.constants import INDEX_SEARCH_K
+from wizz.extraction.embedder import Embedder
+from wizz.extraction.vector_index import open_vector_index
+from wizz.interface.enums import EmbeddingBackend
+from wizz.interface.enums import SearchMode
+
+RankedBlobs = list[tuple[int, float]]
+
+
+class BlobRanker:
+    """Rank the blobs of a context for queries in a search mode.
+
+    Vector search ranks by the index of blob vectors, lexical search
+    by BM25 over the full text index, and hybrid search fuses both.
+    Lexical search never loads the embedding model.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        context_name: str,
+        *,
+        mode: SearchMode = SearchMode.vector,
+        backend: EmbeddingBackend = EmbeddingBackend.torch,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        search_k: int = INDEX_SEARCH_K,
+    ) -> None:
+        """Load the model and open the index, if the mode needs them."""
+        self.context_name = context_name
+        self.mode = mode
+        self.search_k = search_k
+        if mode != SearchMode.lexical:
+            # Queries rarely repeat, so caching them only grows the cache.
+            self.embedder = Embedder(
+                batch_size=batch_size,
+                use_cache=False,
+                backend=backend,
+            )
+            self.blob_index = open_vector_index(
+                converters.to_blob_ix_name(context_name),
+            )
+
+    async def rank(
+        self,
+        session: AsyncSession,
+        query: str,
+        *,
+        n: int,  # noqa: WPS111
+    ) -> RankedBlobs:
+        """Rank the n blobs that fit a query best, best first."""
+        all_ranked_blobs = await self.rank_many(session, [query], n=n)
+        return all_ranked_blobs[0]
+
+    async def rank_many(
+        self,
+        session: AsyncSession,
+        queries: Sequence[str],
+        *,
+        n: int,  # noqa: WPS111
+        executor: Executor | None = None,
+    ) -> list[RankedBlobs]:
+        """Rank blobs for every query, embedding the queries in batches.
+
+        Index lookups run in the executor, if one is given.
+        """
+        candidates = n
+        if self.mode == SearchMode.hybrid:
+            candidates = max(n, constants.HYBRID_CANDIDATES)
+        rankings: list[list[RankedBlobs]] = []
+        if self.mode != SearchMode.lexical:
+            rankings.append(
+                await self._look_up_vectors(queries, candidates, executor),
+            )
+        if self.mode != SearchMode.vector:
+            rankings.append([
+                await crud.search_blobs_lexically(
+                    session,
+                    context_name=self.context_name,
+                    query=query,
+                    n=candidates,
+                )
+                for query in queries
+            ])
+        if self.mode == SearchMode.hybrid:
+            return [
+                fuse_rankings(*query_rankings, n=n)
+                for query_rankings in zip(*rankings)
+            ]
+        return rankings[0]
+
+    async def _look_up_vectors(
+        self,
+        queries: Sequence[str],
+        n: int,  # noqa: WPS111
+        executor: Executor | None,
+    ) -> list[RankedBlobs]:
+        """Embed the queries and find their closest blobs in the index.
+
+        The vectors are looked up in batches, one batch per task.
+        """
+        vectors = self.embedder.encode(queries)
+        batch_size = constants.INDEX_LOOKUP_BATCH_SIZE
+        loop = asyncio.get_running_loop()
+        batch_rankings = await asyncio.gather(*(
+            loop.run_in_executor(
+                executor,
+                partial(
+                    self.blob_index.get_ranked_neighbours_for_many,
+                    vectors=vectors[start:start + batch_size],
+                    n=n,
+                    search_k=self.search_k,
+                ),
+            )
+            for start in range(0, len(vectors), batch_size)
+        ))
+        return [
+            ranked_blobs
+            for rankings in batch_rankings
+            for ranked_blobs in rankings
+        ]
+
+
+def fuse_rankings(
+    *rankings: RankedBlobs,
+    n: int,  # noqa: WPS111
+) -> RankedBlobs:
+    """Fuse rankings of blobs with reciprocal rank fusion.
+
+    A blob scores the sum of 1 / (RRF_K + rank) over the rankings
+    that have it. Scores are negated, so lower ranks first, like
+    distances.
+    """
+    scores: defaultdict[int, float] = defaultdict(float)
+    for ranked_blobs in rankings:
+        for rank, (blob_id, _) in enumerate(ranked_blobs, start=1):
+            scores[blob_id] -= 1 / (constants.RRF_K + rank)
+    fused_blobs = sorted(
+        scores.items(),
+        key=lambda blob_score: blob_score[1],
+    )
+    return fused_blobs[:n]
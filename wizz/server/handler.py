@@ -0,0 +1,140 @@
+import asyncio
+from http import HTTPStatus
+from logging import getLogger
+from typing import Any
+
+from wizz.constants import SEARCH_RESULT_COUNT
+from wizz.server.protocol import HttpRequest
+from wizz.server.protocol import read_request
+from wizz.server.protocol import RequestError
+from wizz.server.protocol import write_response
+from wizz.server.service import SearchService
+
+logger = getLogger('wizz')
+
+Payload = dict[str, Any]
+
+
+class RequestHandler:
+    """Serve the connections of HTTP clients with a search service.
+
+    POST /search and POST /answer take a JSON object with a context,
+    a query, and optionally k results and search_k. GET /health
+    answers once the service is up. A connection can send any number
+    of requests, and every connection is served concurrently.
+    """
+
+    def __init__(self, service: SearchService) -> None:
+        """Route requests to a service."""
+        self.service = service
+
+    async def __call__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Serve the requests of a connection until it closes."""
+        try:
+            await self._serve_connection(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.debug('A client closed its connection mid-request.')
+        finally:
+            writer.close()
+            await asyncio.gather(writer.wait_closed(), return_exceptions=True)
+
+    async def _serve_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Answer requests one by one while the client keeps them coming."""
+        keep_alive = True
+        while keep_alive:
+            try:
+                request = await read_request(reader)
+            except RequestError as error:
+                await write_response(
+                    writer,
+                    error.status,
+                    {'error': str(error)},
+                    keep_alive=False,
+                )
+                return
+            if request is None:
+                return
+            keep_alive = request.keep_alive
+            status, response = await self._respond(request)
+            await write_response(
+                writer,
+                status,
+                response,
+                keep_alive=keep_alive,
+            )
+
+    async def _respond(
+        self,
+        request: HttpRequest,
+    ) -> tuple[HTTPStatus, Payload]:
+        """Get the status and the payload to answer a request with.
+
+        An unexpected error is logged and answered with a server error,
+        so the connection and the server keep running.
+        """
+        try:
+            return HTTPStatus.OK, await self._route(request)
+        except RequestError as error:
+            return error.status, {'error': str(error)}
+        except Exception:
+            logger.exception(
+                'Failed to answer %s %s.',
+                request.method,
+                request.path,
+            )
+            return (
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                {'error': 'The server failed to answer the request.'},
+            )
+
+    async def _route(self, request: HttpRequest) -> Payload:
+        """Pass a request to the endpoint of its method and path."""
+        route = (request.method, request.path)
+        if route == ('GET', '/health'):
+            return {'status': 'ok'}
+        if route == ('POST', '/search'):
+            return {
+                'results': await self.service.search(
+                    **_parse_search(request.json()),
+                ),
+            }
+        if route == ('POST', '/answer'):
+            answer, search_results = await self.service.answer(
+                **_parse_search(request.json()),
+            )
+            return {'answer': answer, 'results': search_results}
+        raise RequestError(
+            HTTPStatus.NOT_FOUND,
+            f'No endpoint for {request.method} {request.path}.',
+        )
+
+
+def _parse_search(payload: Payload) -> Payload:
+    """Validate the parameters of a search and name them for the service."""
+    context_name = payload.get('context')
+    query = payload.get('query')
+    if not isinstance(context_name, str) or not isinstance(query, str):
+        raise RequestError(
+            HTTPStatus.BAD_REQUEST,
+            'A context and a query are required strings.',
+        )
+    n = payload.get('k', SEARCH_RESULT_COUNT)  # noqa: WPS111
+    search_k = payload.get('search_k')
+    if not isinstance(n, int) or n < 1:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'k must be positive.')
+    if search_k is not None and not isinstance(search_k, int):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'search_k is an integer.')
+    return {
+        'context_name': context_name,
+        'query': query,
+        'n': n,
+        'search_k': search_k,
+    }
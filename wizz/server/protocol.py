@@ -0,0 +1,116 @@
+import asyncio
+import json
+from http import HTTPStatus
+from typing import Any
+from typing import NamedTuple
+
+from wizz.constants import SERVE_MAX_BODY_SIZE
+
+_HEADER_END = frozenset((b'\r\n', b'\n', b''))
+
+
+class RequestError(Exception):
+    """A request that can not be served, with the status to answer it."""
+
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        """Keep the status next to the message."""
+        super().__init__(message)
+        self.status = status
+
+
+class HttpRequest(NamedTuple):
+    """The parts of an HTTP request the server routes on."""
+
+    method: str
+    path: str
+    body: bytes
+    keep_alive: bool
+
+    def json(self) -> dict[str, Any]:
+        """Parse the body as a JSON object."""
+        if not self.body:
+            return {}
+        try:
+            payload = json.loads(self.body)
+        except ValueError as error:
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(error))
+        if not isinstance(payload, dict):
+            raise RequestError(
+                HTTPStatus.BAD_REQUEST,
+                'The body must be a JSON object.',
+            )
+        return payload
+
+
+async def read_request(reader: asyncio.StreamReader) -> HttpRequest | None:
+    """Read the next request of a connection, if the client sent one."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'Malformed request line.')
+    headers = await _read_headers(reader)
+    return HttpRequest(
+        method=method.upper(),
+        path=target.split('?', 1)[0],
+        body=await _read_body(reader, headers),
+        keep_alive=_is_keep_alive(version, headers),
+    )
+
+
+async def write_response(
+    writer: asyncio.StreamWriter,
+    status: HTTPStatus,
+    payload: dict[str, Any],
+    *,
+    keep_alive: bool,
+) -> None:
+    """Send a JSON response and wait until it can be written further."""
+    body = json.dumps(payload).encode()
+    content_length = len(body)
+    head = '\r\n'.join((
+        f'HTTP/1.1 {status.value} {status.phrase}',
+        'Content-Type: application/json',
+        f'Content-Length: {content_length}',
+        'Connection: {0}'.format('keep-alive' if keep_alive else 'close'),
+        '',
+        '',
+    ))
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+    """Read header lines up to the empty line before the body."""
+    headers = {}
+    while (line := await reader.readline()) not in _HEADER_END:
+        name, _, header_value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = header_value.strip()
+    return headers
+
+
+def _is_keep_alive(version: str, headers: dict[str, str]) -> bool:
+    """Check whether the client wants the connection to stay open."""
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        return connection != 'close'
+    return connection == 'keep-alive'
+
+
+async def _read_body(
+    reader: asyncio.StreamReader,
+    headers: dict[str, str],
+) -> bytes:
+    """Read as many bytes of body as the headers announce."""
+    try:
+        content_length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'Malformed Content-Length.')
+    if content_length > SERVE_MAX_BODY_SIZE:
+        raise RequestError(
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            f'Bodies are limited to {SERVE_MAX_BODY_SIZE} bytes.',
+        )
+    return await reader.readexactly(max(content_length, 0))
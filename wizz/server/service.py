@@ -0,0 +1,137 @@
+import asyncio
+from http import HTTPStatus
+from typing import Any
+
+from wizz import crud
+from wizz.agent.retriever import Retriever
+from wizz.database import get_db_session
+from wizz.extraction import converters
+from wizz.extraction.constants import INDEX_SEARCH_K
+from wizz.extraction.query_batcher import QueryBatcher
+from wizz.extraction.vector_index import open_vector_index
+from wizz.extraction.vector_index import read_build_version
+from wizz.extraction.vector_index import VectorIndex
+from wizz.server.protocol import RequestError
+
+SearchResult = dict[str, Any]
+
+
+class SearchService:
+    """Search the knowledge of any context with models kept in memory.
+
+    The embedder, the opened indices and the pooled database
+    connections live as long as the service, so a request only pays
+    for its own query. An index is opened again once it is rebuilt.
+    """
+
+    def __init__(
+        self,
+        batcher: QueryBatcher,
+        *,
+        search_k: int = INDEX_SEARCH_K,
+    ) -> None:
+        """Serve with an embedding batcher and a default search_k."""
+        self.batcher = batcher
+        self.search_k = search_k
+        self._indices: dict[str, tuple[int, VectorIndex]] = {}
+
+    async def search(
+        self,
+        *,
+        context_name: str,
+        query: str,
+        n: int,  # noqa: WPS111
+        search_k: int | None = None,
+    ) -> list[SearchResult]:
+        """Find the n blobs closest to the query, closest first."""
+        blob_index = self._open_blob_index(context_name)
+        # The lookup runs in a thread to keep the event loop serving.
+        ranked_blobs = await asyncio.to_thread(
+            blob_index.get_ranked_neighbours_for,
+            vector=await self.batcher.embed(query),
+            n=n,
+            search_k=self.search_k if search_k is None else search_k,
+        )
+        return await _load_search_results(ranked_blobs)
+
+    async def answer(
+        self,
+        *,
+        context_name: str,
+        query: str,
+        n: int,  # noqa: WPS111
+        search_k: int | None = None,
+    ) -> tuple[str, list[SearchResult]]:
+        """Answer the query with the LLM, based on the search results.
+
+        Every answer gets its own chat, so requests share no history.
+        """
+        search_results = await self.search(
+            context_name=context_name,
+            query=query,
+            n=n,
+            search_k=search_k,
+        )
+        answer = await asyncio.to_thread(
+            _request_answer,
+            query,
+            search_results,
+        )
+        return answer, search_results
+
+    def _open_blob_index(self, context_name: str) -> VectorIndex:
+        """Get the opened blob index of a context, if it is up to date."""
+        blob_ix_name = converters.to_blob_ix_name(context_name)
+        build_version = read_build_version(blob_ix_name)
+        opened_version, blob_index = self._indices.get(
+            blob_ix_name,
+            (None, None),
+        )
+        if blob_index is None or opened_version != build_version:
+            try:
+                blob_index = open_vector_index(blob_ix_name)
+            except ValueError:
+                raise RequestError(
+                    HTTPStatus.NOT_FOUND,
+                    f'Context {context_name} is not indexed.',
+                )
+            # A rebuild can follow a deletion that freed blob IDs.
+            crud.clear_blob_cache()
+            self._indices[blob_ix_name] = (build_version, blob_index)
+        return blob_index
+
+
+async def _load_search_results(
+    ranked_blobs: list[tuple[int, float]],
+) -> list[SearchResult]:
+    """Load the ranked blobs with their sources, closest first."""
+    async with get_db_session() as session:
+        retrieved_blobs = await crud.retrieve_ranked_blobs(
+            session,
+            ranked_blobs=ranked_blobs,
+        )
+    return [
+        {
+            'blob_id': blob.blob_id,
+            'blob_index': blob.blob_index,
+            'source': blob.source_name,
+            'text': blob.text,
+            'distance': blob.distance,
+        }
+        for blob in retrieved_blobs
+    ]
+
+
+def _request_answer(query: str, search_results: list[SearchResult]) -> str:
+    """Ask a new retriever chat for an answer based on search results."""
+    retriever = Retriever()
+    return retriever.request_answer_based_on(
+        *(
+            retriever.wrap_result(
+                search_result['source'],
+                search_result['text'],
+            )
+            for search_result in search_results
+        ),
+        query=query,
+    )